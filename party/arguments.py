@@ -7,6 +7,15 @@ import constants
 import dotparty
 import util
 
+def positive_int(value):
+  '''Parse an integer argument that must be at least 1.'''
+
+  result = int(value)
+  if result < 1:
+    raise argparse.ArgumentTypeError('%s is not a positive integer' % value)
+
+  return result
+
 def add_debug_argument(parser):
   '''Add a --debug flag to a parser.'''
 
@@ -16,31 +25,117 @@ def add_debug_argument(parser):
     help='enable debug output'
   )
 
-def add_link_subparser(subparsers):
-  p = subparsers.add_parser('link',
-      help='link dotfiles into the destination directory')
+def add_report_arguments(parser):
+  '''
+  Add the flags that report what a command did and where it spent its time to
+  a parser. They default to nothing, so passing them to a subcommand doesn't
+  undo passing them before it. The real defaults live on the top-level parser.
+  '''
 
-  add_debug_argument(p)
+  parser.add_argument(
+    '--profile',
+    action='store_true',
+    default=argparse.SUPPRESS,
+    help=('print the time spent in each phase and the filesystem and git '
+        'operations performed to stderr on exit')
+  )
 
-  p.add_argument(
+  parser.add_argument(
+    '--profile-json',
+    default=argparse.SUPPRESS,
+    metavar='FILE',
+    help='write the same report to FILE as JSON on exit'
+  )
+
+  parser.add_argument(
+    '--metrics',
+    default=argparse.SUPPRESS,
+    metavar='FILE',
+    help=('write metrics about the run to FILE in the OpenMetrics text format '
+        'on exit, e.g. for the node_exporter textfile collector')
+  )
+
+def add_link_arguments(parser):
+  '''Add the arguments that control linking to a parser.'''
+
+  parser.add_argument(
     '-f', '--force',
     action='store_true',
     help='overwrite existing files at link destinations'
   )
 
-  p.add_argument(
+  parser.add_argument(
     '-t', '--test',
     action='store_true',
     help="don't actually create destination links (useful for testing)"
   )
 
+  parser.add_argument(
+    '-r', '--rescan',
+    action='store_true',
+    help=('check every entry in the repo, not just those that changed since '
+        'the last link')
+  )
+
+  parser.add_argument(
+    '--format',
+    choices=('text', 'jsonl'),
+    default='text',
+    help=('how to report each destination: colored text, or one JSON object '
+        'per line as soon as it has been handled')
+  )
+
+  parser.add_argument(
+    '-j', '--jobs',
+    type=positive_int,
+    default=1,
+    metavar='N',
+    help=('check and create up to N links at once (useful on high-latency '
+        'filesystems)')
+  )
+
+def add_link_subparser(subparsers):
+  p = subparsers.add_parser('link',
+      help='link dotfiles into the destination directory')
+
+  add_debug_argument(p)
+  add_report_arguments(p)
+  add_link_arguments(p)
+
   p.set_defaults(command=dotparty.link)
 
+def add_watch_subparser(subparsers):
+  p = subparsers.add_parser('watch',
+      help='link dotfiles, then relink them whenever they change')
+
+  add_debug_argument(p)
+  add_report_arguments(p)
+  add_link_arguments(p)
+
+  p.add_argument(
+    '--delay',
+    type=float,
+    default=0.5,
+    metavar='SECONDS',
+    help='wait for changes to settle this long before relinking'
+  )
+
+  p.add_argument(
+    '--interval',
+    type=float,
+    default=1.0,
+    metavar='SECONDS',
+    help="how often to check for changes when inotify isn't available"
+  )
+
+  p.set_defaults(command=dotparty.watch)
+
 def add_install_subparser(subparsers):
   p = subparsers.add_parser('install',
       help='install the current configured packages')
 
   add_debug_argument(p)
+  add_report_arguments(p)
 
   p.add_argument(
     'package',
@@ -56,6 +151,7 @@ def add_manage_subparser(subparsers):
           'with a link, and add the new file to the repo (if possible)'))
 
   add_debug_argument(p)
+  add_report_arguments(p)
 
   p.add_argument(
     'path',
@@ -69,13 +165,43 @@ def add_manage_subparser(subparsers):
     help='overwrite any existing files in the dotparty directory'
   )
 
+  p.add_argument(
+    '-s', '--save',
+    action='store_true',
+    help='commit the newly-managed file to the repo and push it upstream'
+  )
+
   p.set_defaults(command=dotparty.manage)
 
+def add_migrate_subparser(subparsers):
+  p = subparsers.add_parser('migrate',
+      help='move hidden per-file config files into the manifest file')
+
+  add_debug_argument(p)
+  add_report_arguments(p)
+
+  p.add_argument(
+    '-k', '--keep',
+    action='store_true',
+    help="don't remove the config files once they've been migrated"
+  )
+
+  p.set_defaults(command=dotparty.migrate)
+
 def add_update_subparser(subparsers):
   p = subparsers.add_parser('update',
       help='download updates to installed packages')
 
   add_debug_argument(p)
+  add_report_arguments(p)
+  add_link_arguments(p)
+
+  p.add_argument(
+    '--prefetch',
+    action='store_true',
+    help=('only download updates so a later update can apply them without '
+        'waiting on the network (useful from cron)')
+  )
 
   p.add_argument(
     'package',
@@ -89,6 +215,7 @@ def add_upgrade_subparser(subparsers):
   p = subparsers.add_parser('upgrade',
       help='upgrade dotparty to the latest version')
   add_debug_argument(p)
+  add_report_arguments(p)
   p.set_defaults(command=dotparty.upgrade)
 
 def parse(args=None, namespace=None):
@@ -97,6 +224,8 @@ def parse(args=None, namespace=None):
   p = argparse.ArgumentParser(prog='dotparty')
 
   add_debug_argument(p)
+  add_report_arguments(p)
+  p.set_defaults(profile=False, profile_json=None, metrics=None)
 
   p.add_argument(
     '--version',
@@ -108,8 +237,10 @@ def parse(args=None, namespace=None):
 
   # add the commands available on the base argument parser
   add_link_subparser(subparsers)
+  add_watch_subparser(subparsers)
   add_install_subparser(subparsers)
   add_manage_subparser(subparsers)
+  add_migrate_subparser(subparsers)
   add_update_subparser(subparsers)
   add_upgrade_subparser(subparsers)
 
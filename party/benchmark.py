@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+'''
+Time each phase of linking against synthetic dotfile repos of various sizes,
+plus interpreter and dotparty startup, and print the results as JSON so they
+can be compared between releases.
+
+Usage: python benchmark.py [--sizes N [N ...]] [--output FILE]
+'''
+
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import config
+import constants
+import linker
+import util
+
+# the machine id the synthetic repos are linked for
+MACHINE_ID = 'bench'
+
+# the repo sizes we time by default
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+# how many times to run each startup command, of which we report the median
+STARTUP_RUNS = 10
+
+def generate_repo(repo_dir, size):
+  '''
+  Fill repo_dir with `size` synthetic entries that exercise every naming rule:
+  plain names, leading '_' characters, '@machine' suffixes for this and other
+  machines, hidden config files, and names matched by ignore globs.
+  '''
+
+  util.mkdir(repo_dir)
+
+  for i in range(size):
+    kind = i % 10
+
+    if kind == 0:
+      name = '_file%d' % i
+    elif kind == 1:
+      name = 'file%d@%s' % (i, MACHINE_ID)
+    elif kind == 2:
+      name = 'file%d@othermachine' % i
+    elif kind == 3:
+      name = 'ignored%d' % i
+    else:
+      name = 'file%d' % i
+
+    with open(os.path.join(repo_dir, name), 'w') as f:
+      f.write(name)
+
+    # send some files deeper into the destination with a config file
+    if kind == 4:
+      with open(os.path.join(repo_dir, '.' + name), 'w') as f:
+        json.dump({'paths': ['.config/dir%d/%s' % (i % 50, name)]}, f)
+
+def write_configs(root):
+  '''Write the user config and machine file for a synthetic run.'''
+
+  user_path = os.path.join(root, 'party.json')
+  with open(user_path, 'w') as f:
+    json.dump({
+      'destination': os.path.join(root, 'home'),
+      'ignore': ['ignored*', 'nothing-matches-*'],
+    }, f)
+
+  machine_file_path = os.path.join(root, 'party-machine')
+  with open(machine_file_path, 'w') as f:
+    json.dump({'id': MACHINE_ID}, f)
+
+  return user_path, machine_file_path
+
+def timed(results, name, fn, *args, **kwargs):
+  '''Call fn, store how many seconds it took in results, and return its result.'''
+
+  start = timeit.default_timer()
+  result = fn(*args, **kwargs)
+  results[name] = timeit.default_timer() - start
+
+  return result
+
+def bench_size(size):
+  '''Time every phase of linking a synthetic repo with `size` entries.'''
+
+  root = tempfile.mkdtemp(prefix='dotparty-bench-')
+  try:
+    repo_dir = os.path.join(root, 'repo')
+    generate_repo(repo_dir, size)
+    user_path, machine_file_path = write_configs(root)
+
+    results = {}
+    load = lambda cache_path: config.load_config(
+        user_path=user_path,
+        ignore_path=os.path.join(repo_dir, '.partyignore'),
+        machine_file_path=machine_file_path,
+        cache_path=cache_path,
+        repo_dir=repo_dir)
+
+    # the first load builds the config cache, the second uses it
+    cache_path = os.path.join(root, 'cache', 'config.json')
+    timed(results, 'load_config_cold', load, cache_path)
+    conf = timed(results, 'load_config_warm', load, cache_path)
+
+    entries = timed(results, 'scan', config.scan_repo, repo_dir,
+        conf['ignore'])
+
+    def get_file_configs():
+      links = {}
+      for entry in entries:
+        file_config = config.get_file_config(entry.path, conf['destination'],
+            entry=entry)
+        if config.machine_matches(conf['machine_names'],
+            file_config['machines']):
+          links[entry.path] = file_config
+      return links
+
+    links = timed(results, 'get_file_config', get_file_configs)
+
+    # plan and apply into an empty destination, then plan again now that every
+    # link already exists.
+    dirs = set()
+    steps = timed(results, 'plan', linker.plan, links, dirs=dirs)
+    timed(results, 'apply', linker.apply, steps, dirs=dirs)
+    timed(results, 'plan_unchanged', linker.plan, links)
+
+    results['entries'] = len(entries)
+    results['links'] = len(steps)
+
+    return results
+  finally:
+    shutil.rmtree(root)
+
+def bench_command(cmd):
+  '''Return the median wall time of running a command, in seconds.'''
+
+  times = []
+  with open(os.devnull, 'w') as devnull:
+    for i in range(STARTUP_RUNS):
+      start = timeit.default_timer()
+      subprocess.call(cmd, stdout=devnull, stderr=devnull)
+      times.append(timeit.default_timer() - start)
+
+  times.sort()
+  return times[len(times) // 2]
+
+def bench_startup():
+  '''Time bare interpreter startup, and dotparty's startup on top of it.'''
+
+  script = os.path.join(constants.SCRIPT_DIR, 'dotparty.py')
+  return {
+    'interpreter': bench_command([sys.executable, '-c', 'pass']),
+    'dotparty_version': bench_command([sys.executable, script, '--version']),
+  }
+
+def main():
+  p = argparse.ArgumentParser(prog='benchmark',
+      description='time dotparty against synthetic repos')
+
+  p.add_argument(
+    '--sizes',
+    type=int,
+    nargs='+',
+    default=DEFAULT_SIZES,
+    metavar='N',
+    help='the numbers of repo entries to benchmark with'
+  )
+
+  p.add_argument(
+    '--output',
+    metavar='FILE',
+    help='write the results to FILE instead of stdout'
+  )
+
+  args = p.parse_args()
+
+  results = {
+    'version': '.'.join(map(str, constants.VERSION)),
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'startup': bench_startup(),
+    'sizes': dict((str(size), bench_size(size)) for size in args.sizes),
+  }
+
+  output = json.dumps(results, indent=2, sort_keys=True)
+  if args.output is None:
+    print(output)
+  else:
+    with open(args.output, 'w') as f:
+      f.write(output + '\n')
+
+if __name__ == '__main__':
+  main()
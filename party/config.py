@@ -1,49 +1,129 @@
 from __future__ import unicode_literals
 
 import collections
+import errno
 import json
 import os
 import platform
 
 import constants
+import ignore
+import timing
 import util
 
-def get_machine_id(machine_file_path=constants.MACHINE_ID_PATH):
+# bumped whenever the cached config format changes incompatibly
+CONFIG_CACHE_VERSION = 2
+
+# a linkable entry in the repo, and the path to its config file if it has one
+RepoEntry = collections.namedtuple('RepoEntry', ['path', 'config_path'])
+
+def get_hostname_id():
+  '''Return a machine id based on the hostname, or None if there isn't one.'''
+
+  machine_id = platform.node()
+  if machine_id == '':
+    return None
+
+  # fix OSX hostnames returning '.local' at the end
+  local_suffix = '.local'
+  if machine_id.endswith(local_suffix):
+    machine_id = machine_id[:-len(local_suffix)]
+
+  return machine_id
+
+def load_machine_file(machine_file_path=constants.MACHINE_ID_PATH):
   '''
-  Load the machine id, normalize it, and return it. If there's no machine id
-  file, return the hostname of the system. If that's not available, return None.
+  Load the machine file and return a tuple of the machine id and its list of
+  tags, or (None, []) if there's no machine file.
+
+  Machine File Format
+  ----
+
+  ```json
+  {
+    "id": "machineid1",
+    "tags": ["laptop", "work"]
+  }
+  ```
+
+  The `tags` key may be omitted.
   '''
 
-  machine_id = None
+  if not os.path.exists(machine_file_path):
+    return (None, [])
 
-  # use the machine file if it exists, otherwise fall back on the hostname
-  if os.path.exists(machine_file_path):
-    with open(machine_file_path) as f:
-      machine_id = json.load(f)['id']
-  elif platform.node() != '':
-    machine_id = platform.node()
+  with open(machine_file_path) as f:
+    machine = json.load(f)
 
-    # fix OSX hostnames returning '.local' at the end
-    local_suffix = '.local'
-    if machine_id.endswith(local_suffix):
-      machine_id = machine_id[:-len(local_suffix)]
+  return (machine['id'], sorted(frozenset(machine.get('tags', []))))
 
-  return machine_id
+def resolve_machine_names(machine_id, tags=(), groups=None):
+  '''
+  Return a frozenset of every name the given machine goes by: its id, its tags,
+  and every group that lists the id or one of the tags as a member. `groups`
+  maps group names to lists of members.
+  '''
 
-def machine_matches(machine_id, machines):
+  names = set(tags)
+  if machine_id is not None:
+    names.add(machine_id)
+
+  if groups:
+    members = frozenset(names)
+    for group, group_members in groups.iteritems():
+      if not members.isdisjoint(group_members):
+        names.add(group)
+
+  return frozenset(names)
+
+def machine_matches(machine_names, machines):
   '''
-  Test a machine id against a list of machines, and return whether the given id
-  matches against the list.
+  Test a machine's names against a list of machines, and return whether any of
+  them matches against the list. `machine_names` should be a set like the one
+  `resolve_machine_names` returns, so the check costs one set lookup per listed
+  machine. A single machine id is accepted too.
 
   A machine matches if either the machines list is empty (indicating 'all
-  machines'), or the given id exists in the machines list.
+  machines'), or any of the given names exists in the machines list.
   '''
 
-  return len(machines) == 0 or machine_id in machines
+  if len(machines) == 0:
+    return True
 
-def load_config(user_path=constants.USER_CONFIG_PATH,
-    default_path=constants.DEFAULT_CONFIG_PATH):
-  '''Load the default dotparty config file, then overlay the user's on top.'''
+  if not isinstance(machine_names, (set, frozenset)):
+    return machine_names in machines
+
+  return not machine_names.isdisjoint(machines)
+
+def load_ignore_file(path=constants.IGNORE_FILE_PATH):
+  '''Return the lines of the given gitignore-style file, or [] if it's missing.'''
+
+  if not os.path.isfile(path):
+    return []
+
+  with open(path) as f:
+    return [line.decode('utf-8') for line in f]
+
+def file_signature(path):
+  '''
+  Return a signature of the given file's modification time and size, or None
+  if it doesn't exist. Used to tell whether a cached file is out of date.
+  '''
+
+  try:
+    info = os.stat(path)
+  except OSError as e:
+    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+      return None
+    raise
+
+  return [info.st_mtime, info.st_size]
+
+def build_config(user_path, default_path, ignore_path):
+  '''
+  Load the default dotparty config file, overlay the user's on top, and return
+  the merged result. It contains only plain JSON values, so it can be cached.
+  '''
 
   # make sure we can load our default config file
   assert os.path.exists(default_path)
@@ -68,11 +148,11 @@ def load_config(user_path=constants.USER_CONFIG_PATH,
   # this because we always need to ignore our own files, and it's cleaner to do
   # so through the normal ignore channel than to write custom checks everywhere.
   if 'ignore' in user_config:
-    config['ignore'] = frozenset(default_config['ignore'] + user_config['ignore'])
+    config['ignore'] = sorted(
+        frozenset(default_config['ignore'] + user_config['ignore']))
 
-  # expand globs in the ignored list and root them in the dotparty directory
-  config['ignore'] = frozenset(
-      util.expand_globs(config['ignore'], root=constants.REPO_DIR))
+  # keep the ignore file's rules alongside the configured patterns
+  config['ignore_lines'] = load_ignore_file(ignore_path)
 
   # normalize the destination directory
   config['destination'] = util.normpath(config['destination'])
@@ -81,6 +161,81 @@ def load_config(user_path=constants.USER_CONFIG_PATH,
 
   return config
 
+def load_config(user_path=constants.USER_CONFIG_PATH,
+    default_path=constants.DEFAULT_CONFIG_PATH,
+    ignore_path=constants.IGNORE_FILE_PATH,
+    machine_file_path=constants.MACHINE_ID_PATH,
+    cache_path=constants.CONFIG_CACHE_PATH,
+    repo_dir=constants.REPO_DIR):
+  '''
+  Load the default dotparty config file, then overlay the user's on top. Rules
+  from the repo's `.partyignore` file are applied after the configured ignore
+  patterns, and both are rooted in repo_dir. The machine id is loaded too, and
+  stored under `machine_id`, along with the set of every name the machine goes
+  by under `machine_names`.
+
+  The merged config and machine id are cached, and the cache is only rebuilt
+  when the modification time or size of one of the input files changes. Machine
+  ids that come from the hostname are never cached, since the hostname can
+  change without any file changing.
+  '''
+
+  inputs = {
+    'repo_dir': repo_dir,
+    'default': file_signature(default_path),
+    'user': file_signature(user_path),
+    'ignore': file_signature(ignore_path),
+    'machine': file_signature(machine_file_path),
+  }
+
+  # use the cache if it was built from exactly these inputs
+  cached = None
+  try:
+    with open(cache_path) as f:
+      cached = json.load(f)
+  except (IOError, ValueError):
+    pass
+
+  if (cached is not None and
+      cached.get('version') == CONFIG_CACHE_VERSION and
+      cached.get('inputs') == inputs):
+    config = cached['config']
+    machine_id = cached['machine_id']
+    tags = cached['machine_tags']
+  else:
+    config = build_config(user_path, default_path, ignore_path)
+    with timing.phase('machine_id'):
+      machine_id, tags = load_machine_file(machine_file_path)
+
+    # the cache is only an optimization, so failing to write it is fine
+    try:
+      util.write_json(cache_path, {
+        'version': CONFIG_CACHE_VERSION,
+        'inputs': inputs,
+        'config': config,
+        'machine_id': machine_id,
+        'machine_tags': tags,
+      })
+    except EnvironmentError:
+      pass
+
+  with timing.phase('machine_id'):
+    if machine_id is None:
+      machine_id = get_hostname_id()
+    config['machine_id'] = machine_id
+
+    # work out every name this machine goes by once, so matching files against
+    # it is a set intersection.
+    config['machine_names'] = resolve_machine_names(machine_id, tags,
+        config.get('groups'))
+
+  # compile the ignored list and the ignore file into a single matcher rooted
+  # in the dotparty directory.
+  config['ignore'] = ignore.IgnoreMatcher(config['ignore'],
+      root=repo_dir, lines=config.pop('ignore_lines'))
+
+  return config
+
 def get_config_path(path):
   '''Return the config file name for a given path.'''
   base, name = os.path.split(path)
@@ -104,8 +259,70 @@ def normalize_file_config(config, dest):
   if 'machines' in config:
     result['machines'] = sorted(frozenset(config['machines']))
 
+  # templates are rendered per-machine, and the render is linked instead
+  if config.get('template'):
+    result['template'] = True
+
   return result
 
+def fill_file_config(config):
+  '''
+  Return a copy of a file config as written, with every key it omits set to
+  what omitting it means in a config file. Overlaying the result on any other
+  config replaces that config entirely, like a config file does.
+  '''
+
+  result = {
+    'paths': [],
+    'machines': [],
+    'template': False,
+  }
+  result.update(config)
+  return result
+
+def scan_repo(repo_dir, ignore):
+  '''
+  List the linkable entries in repo_dir, sorted by path. Config files are found
+  in the same directory listing as the entries they belong to, so scanning costs
+  a single directory read instead of a stat call per entry. Hidden and ignored
+  entries are skipped.
+  '''
+
+  repo_dir = util.normpath(repo_dir)
+  names = os.listdir(repo_dir)
+
+  # every hidden name is a potential config file for some other entry
+  hidden_names = frozenset(n for n in names if n.startswith('.'))
+
+  entries = []
+  ignored = 0
+  for name in sorted(names):
+    if name in hidden_names:
+      continue
+
+    # names from a listing never need more normalization than this
+    path = os.path.join(repo_dir, name)
+    if path in ignore:
+      ignored += 1
+      continue
+
+    # pair the entry with its config file if we saw one
+    config_path = None
+    config_name = util.toggle_hidden(name, True)
+    if config_name in hidden_names:
+      config_path = os.path.join(repo_dir, config_name)
+
+    entries.append(RepoEntry(path, config_path))
+
+  timing.record('ignored_entries', ignored)
+
+  return entries
+
+def read_file_config_file(config_path, dest):
+  '''Read and normalize the config file at the given path.'''
+  with open(config_path, 'r') as f:
+    return normalize_file_config(json.load(f), dest)
+
 def load_file_config_file(path, dest):
   '''
   Load the config for the given path if it exists, otherwise return None.
@@ -123,20 +340,22 @@ def load_file_config_file(path, dest):
     "paths": [
       "relative/path/1",
       "relative/path/2"
-    ]
+    ],
+
+    "template": true
   }
   ```
 
   Keys may be omitted, but beware: an empty `paths` list will result in the
-  file never being linked!
+  file never being linked! If `template` is true, the file is rendered with the
+  machine's variables (see `template.get_variables`) and its render is linked
+  instead of the file itself.
   '''
 
   # if a config file exists, return its JSON contents
   config_path = get_config_path(path)
   if os.path.isfile(config_path):
-    config = None
-    with open(config_path, 'r') as f:
-      return normalize_file_config(json.load(f), dest)
+    return read_file_config_file(config_path, dest)
 
   # otherwise, signal that no file existed
   return None
@@ -150,7 +369,7 @@ def parse_file_config(path, dest):
 
   * First leading '_' is replaced with a '.'.
   * When split on '@', every part excluding the first is treated as a machine id
-    on which to link the given file.
+    (or a machine tag or group) on which to link the given file.
   * Any file named the same as the local file preceded by a '.' is treated as a
     special config file for that local file.
   * Any of these rules may be combined.
@@ -217,12 +436,70 @@ def configify_file_name(path):
 
   return (configified_path, config_file_path)
 
-def get_file_config(path, dest):
+def load_manifest(path=constants.MANIFEST_PATH):
+  '''
+  Load the repo's manifest file if it exists, otherwise return an empty dict.
+
+  Manifest File Format
+  ----
+
+  The manifest maps entry names in the repo to configs in the same format as
+  config files. Keys that are omitted fall back to what the entry's name says.
+
+  ```json
+  {
+    "_vimrc": {
+      "machines": ["machineid1"]
+    },
+
+    "ssh-config": {
+      "paths": [".ssh/config"]
+    }
+  }
+  ```
+  '''
+
+  if not os.path.isfile(path):
+    return {}
+
+  with open(path) as f:
+    return json.load(f)
+
+def apply_manifest(file_config, path, dest, manifest):
+  '''
+  Overlay the manifest's config for the given path, if it has one, on top of
+  a normalized file config, and return the normalized result.
+  '''
+
+  if not manifest:
+    return file_config
+
+  overrides = manifest.get(os.path.basename(path))
+  if overrides is None:
+    return file_config
+
+  result = {}
+  result.update(file_config)
+  result.update(overrides)
+  return normalize_file_config(result, dest)
+
+def get_file_config(path, dest, entry=None, manifest=None):
   '''
   Return a normalized config for the given path. If a config file exists for the
-  given path, returns its contents instead and skips parsing.
+  given path, returns its contents instead and skips parsing. If a `RepoEntry`
+  from `scan_repo` is given, its config path is trusted instead of checking the
+  filesystem for one.
+
+  If a manifest is given and has an entry for the path, its keys override those
+  parsed from the file name.
   '''
 
+  if entry is not None:
+    if entry.config_path is not None:
+      return read_file_config_file(entry.config_path, dest)
+    return apply_manifest(parse_file_config(entry.path, dest), entry.path,
+        dest, manifest)
+
   # normalize our path to the destination directory first
   path = util.normalize_to_root(path, dest)
 
@@ -232,4 +509,4 @@ def get_file_config(path, dest):
     return config
 
   # otherwise, parse and return the file name itself
-  return parse_file_config(path, dest)
+  return apply_manifest(parse_file_config(path, dest), path, dest, manifest)
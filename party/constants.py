@@ -8,9 +8,17 @@ import util
 VERSION = (0, 0, 0)
 
 # the git remote where the dotparty repository lives. used for updating dotparty
-# to the latest version.
+# to the latest version, unless the config names another `update_remote`.
 GIT_REMOTE = 'https://github.com/jasontbradshaw/dotparty.git'
 
+# the ref that records the last commit from the remote we updated to, and the
+# one `update --prefetch` downloads updates to.
+UPSTREAM_REF = 'refs/dotparty/upstream'
+PREFETCH_REF = 'refs/dotparty/prefetch'
+
+# how many seconds old prefetched updates can be before we fetch again instead
+PREFETCH_MAX_AGE = 60 * 60
+
 # the directories that the dotparty files and script live in
 # NOTE: these assume that these files are within the script directory!
 REPO_DIR = os.path.dirname(util.normpath(os.path.join(__file__, '../')))
@@ -18,10 +26,27 @@ SCRIPT_DIR = os.path.dirname(util.normpath(__file__))
 
 # config file paths
 MACHINE_ID_PATH = util.normpath('~/.party-machine')
+LINK_STATE_PATH = util.normpath('~/.party-links.json')
 USER_CONFIG_PATH = util.normpath('~/.party.json')
 DEFAULT_CONFIG_PATH = util.normpath(
     os.path.join(SCRIPT_DIR, 'party-default.json'))
 
+# where rendered templates are written, and linked to from
+RENDER_DIR = util.normpath('~/.party-rendered')
+
+# where we keep data that can always be rebuilt from scratch
+CACHE_DIR = util.normpath('~/.party-cache')
+CONFIG_CACHE_PATH = os.path.join(CACHE_DIR, 'config.json')
+GIT_CACHE_PATH = os.path.join(CACHE_DIR, 'git.json')
+UPDATE_RESULT_PATH = os.path.join(CACHE_DIR, 'update.json')
+PREFETCH_PATH = os.path.join(CACHE_DIR, 'prefetch.json')
+
+# gitignore-style ignore rules for the repo directory
+IGNORE_FILE_PATH = os.path.join(REPO_DIR, '.partyignore')
+
+# the optional file holding every entry's config in one place
+MANIFEST_PATH = os.path.join(REPO_DIR, 'party-manifest.json')
+
 # the characters used in our special file names
 DOT_CHARACTER = '_'
 MACHINE_SEPARATOR_CHARACTER = '@'
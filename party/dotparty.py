@@ -3,69 +3,231 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
-# FIXME: remove this!
-from pprint import pprint as pp
-
+import itertools
 import json
 import os
-import shutil
 import sys
-
-from sh import git
+import time
 
 import arguments
 import color
 import config
 import constants
+import gitclient
+import gitindex
+import linker
+import metrics
+import state
+import template
+import timing
 import util
 
+def require_git():
+  '''
+  Make sure a recent enough git is installed, then return a client for running
+  git commands in the repo directory.
+  '''
+
+  util.ensure_git_version(cache_path=constants.GIT_CACHE_PATH)
+  return gitclient.GitClient(constants.REPO_DIR)
+
 def link(conf, args):
   '''Link all files in the repo directory to their configured locations.'''
 
-  # load our machine id so we know which files to link
-  machine_id = config.get_machine_id()
+  return link_entries(conf, args)
 
-  # map all file paths to their destination configs for this machine
-  links = {}
-  for path in os.listdir(constants.REPO_DIR):
-    path = util.normalize_to_root(path, constants.REPO_DIR)
+def link_entries(conf, args, names=None):
+  '''
+  Link files in the repo directory to their configured locations for the
+  configured machine. If a collection of entry names is given, only those
+  entries are revisited (and pruned if they no longer exist), and all others are
+  assumed to be unchanged since the last run and left out of the report.
+  '''
 
-    is_hidden = util.is_hidden(path)
-    is_ignored = path in conf['ignore']
+  # load what we linked last time so we only need to revisit changed entries.
+  # forcing implies a full rescan, since it's meant to fix up everything, as
+  # does naming entries explicitly. a change to anything else that affects
+  # linking, like the manifest, means revisiting everything.
+  manifest = config.load_manifest()
+  variables = template.get_variables(conf)
+  context = {
+    'machine_id': conf['machine_id'],
+    'machine_names': sorted(conf['machine_names']),
+    'destination': conf['destination'],
+    'manifest': util.fingerprint(manifest),
+    'variables': util.fingerprint(variables),
+  }
+  previous = state.load_state(context)
+  rescan = args.rescan or args.force or names is not None
+  current = state.new_state(context)
+
+  # carry over everything we weren't asked to look at
+  if names is not None:
+    names = frozenset(names)
+    for path, recorded in previous['entries'].iteritems():
+      if os.path.basename(path) not in names:
+        current['entries'][path] = recorded
+
+  # map all changed file paths to their destination configs for this machine,
+  # and unchanged ones to the destinations we recorded for them.
+  links = {}
+  unchanged = {}
+  with timing.phase('scan'):
+    entries = config.scan_repo(constants.REPO_DIR, conf['ignore'])
+
+  # time the whole loop at once, since timing each entry costs more than most
+  # entries take. this includes stat-ing entries to see whether they changed.
+  with timing.phase('file_config'):
+    for entry in entries:
+      path = entry.path
+      if names is not None and os.path.basename(path) not in names:
+        continue
+
+      # only config files that were actually listed need a stat
+      sig = state.signature(path)
+      config_sig = None
+      if entry.config_path is not None:
+        config_sig = state.signature(entry.config_path)
+
+      # entries that haven't changed since we last linked them don't need
+      # their config loaded, but their destinations are still checked in case
+      # something removed or replaced them.
+      recorded = previous['entries'].get(path)
+      if not rescan and state.is_current(recorded, sig, config_sig):
+        current['entries'][path] = recorded
+        unchanged[path] = {
+          'paths': recorded['paths'],
+          'target': recorded.get('target') or path,
+        }
+        continue
 
-    if not is_hidden and not is_ignored:
       # load the config for the given path
-      file_config = config.get_file_config(path, conf['destination'])
+      file_config = config.get_file_config(path, conf['destination'],
+          entry=entry, manifest=manifest)
 
       # if the file belongs on this machine, store its config
-      if config.machine_matches(machine_id, file_config['machines']):
+      paths = []
+      if config.machine_matches(conf['machine_names'], file_config['machines']):
         links[path] = file_config
+        paths = file_config['paths']
+
+      # remember non-matching entries too so they're skipped next time
+      current['entries'][path] = {
+        'signature': sig,
+        'config_signature': config_sig,
+        'paths': paths,
+      }
+
+  # render templates across all cores, then link to their renders instead of
+  # the templates. this finishes before any links are touched.
+  failed = []
+  templates = sorted(src for src in links if links[src].get('template'))
+  if len(templates) > 0:
+    with timing.phase('render'):
+      for src, target, error in template.render_files(templates, variables,
+          write=not args.test):
+        file_config = links[src]
+
+        if error is not None:
+          # a template that can't be rendered fails all of its destinations
+          del links[src]
+          failed.extend(linker.Step(src, dest, src, linker.FAIL, error)
+              for dest in file_config['paths'])
+          continue
+
+        file_config['target'] = target
+        current['entries'][src]['target'] = target
+
+  # destinations are independent, so their filesystem work can be spread over
+  # a pool of threads when asked, which helps most on high-latency filesystems.
+  pool = None
+  if args.jobs > 1:
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(args.jobs)
+
+  try:
+    # work out what each destination needs before touching anything, including
+    # removing links we made for entries that have since gone away. directories
+    # seen while planning are remembered so each is only created once.
+    dirs = set()
+    wanted = dict(unchanged)
+    wanted.update(links)
+    with timing.phase('plan'):
+      steps = linker.plan(wanted, dirs=dirs, pool=pool)
+      steps.extend(linker.find_stale(previous['entries'], current['entries'],
+          pool=pool))
+    steps.extend(failed)
+    steps.sort(key=lambda s: s.src)
+
+    # link the files to their destination(s) unless we're doing a dry run,
+    # skipping those that already point at the right place. each destination
+    # is reported as soon as it's done.
+    if args.test:
+      results = ((step, None) for step in steps)
+    else:
+      # overwrite links only by default, everything if forcing
+      overwrite = True if args.force else None
+      results = linker.apply_iter(steps, overwrite=overwrite, dirs=dirs,
+          pool=pool)
+
+    with timing.phase('apply'):
+      if args.format == 'jsonl':
+        steps = print_step_records(results)
+      else:
+        # line up the arrows by the longest link basename
+        max_src_width = 0
+        if len(steps) > 0:
+          max_src_width = max(len(os.path.basename(s.src)) for s in steps)
+        steps = print_steps(results, max_src_width)
+  finally:
+    if pool is not None:
+      pool.close()
+
+  # make sure failed destinations get another look next time, including stale
+  # links we couldn't remove.
+  for step in steps:
+    if step.action == linker.FAIL:
+      recorded = current['entries'].setdefault(step.src, {
+        'config_signature': None,
+        'paths': [],
+      })
+      recorded['signature'] = None
+      if step.dest not in recorded['paths']:
+        recorded['paths'].append(step.dest)
+
+  if not args.test:
+    state.save_state(current)
+
+  counts = linker.count(steps)
+  timing.record('links', counts)
+  if args.format != 'jsonl':
+    print(linker.summarize(counts))
+
+  # only complain once every other destination has been handled
+  if counts[linker.FAIL] > 0:
+    raise ValueError('Failed to link %d destination(s)' % counts[linker.FAIL])
+
+  # return the created links for good measure
+  return links
 
-  # find the longest link basename for pretty output formatting
-  max_src_width = 0
-  if len(links) > 0:
-    max_src_width = max(len(os.path.basename(k)) for k in links.keys())
+def print_steps(results, max_src_width):
+  '''
+  Print each source with all of its destinations, colored by action, as soon as
+  all of them are done. `results` yields tuples of a step and the seconds it
+  took, grouped by source. Returns the list of steps.
+  '''
+
+  steps = []
 
-  # link the files to their destination(s)
   link_symbol = ' -> '
-  for src, info in links.iteritems():
+  src_steps = itertools.groupby((step for step, seconds in results),
+      lambda s: s.src)
+  for src, group in src_steps:
     msg = os.path.basename(src).rjust(max_src_width)
     msg += color.grey(link_symbol)
 
-    for i, dest in enumerate(info['paths']):
-      # the color of the link destination, different when we're creating a new
-      # link, overwriting a link, and overwriting a normal file.
-      dest_color = 'green'
-      if os.path.lexists(dest):
-        dest_color = 'cyan'
-        if not os.path.islink(dest):
-          dest_color = 'yellow'
-
-      # do the symlink unless we're doing a dry run
-      if not args.test:
-        # overwrite links only by default, everything if forcing
-        overwrite = True if args.force else None
-        util.symlink(dest, src, overwrite=overwrite)
+    for i, step in enumerate(group):
+      steps.append(step)
 
       # pad the left space if we're not the first item, since items with
       # multiple destinations are all under the same link name and symbol.
@@ -73,12 +235,115 @@ def link(conf, args):
         msg += os.linesep
         msg += ' ' * (max_src_width + len(link_symbol))
 
-      msg += color.colored(dest, dest_color)
+      msg += color.colored(step.dest, linker.ACTION_COLORS[step.action])
+      if step.error is not None:
+        msg += ' ' + color.red('(' + step.error + ')')
 
     print(msg)
+    sys.stdout.flush()
 
-  # return the created links for good measure
-  return links
+  return steps
+
+def print_step_records(results):
+  '''
+  Print a JSON record for each destination as soon as it's done, one per line.
+  `results` yields tuples of a step and the seconds it took, which is None if
+  the step wasn't applied. Returns the list of steps.
+  '''
+
+  steps = []
+  for step, seconds in results:
+    steps.append(step)
+
+    print(json.dumps({
+      'action': step.action,
+      'src': step.src,
+      'dest': step.dest,
+      'target': step.target,
+      'error': step.error,
+      'seconds': seconds,
+    }, sort_keys=True))
+    sys.stdout.flush()
+
+  return steps
+
+def watch(conf, args):
+  '''
+  Link all files, then watch the repo directory and relink entries whenever
+  they or their config files change.
+  '''
+
+  # only watching needs inotify and friends
+  import watcher
+
+  # the config and machine id stay loaded until something might change them
+  wait = watcher.open_watcher(constants.REPO_DIR, interval=args.interval)
+
+  def relink(names):
+    try:
+      link_entries(conf, args, names=names)
+    except ValueError as e:
+      # keep watching even if some links failed
+      print(color.red('[error]'), e, file=sys.stderr)
+
+  # the manifest and ignore file can affect any entry
+  manifest_name = os.path.basename(constants.MANIFEST_PATH)
+  ignore_name = watcher.entry_name(os.path.basename(constants.IGNORE_FILE_PATH))
+
+  relink(None)
+  if args.format != 'jsonl':
+    print('Watching', color.cyan(constants.REPO_DIR), 'for changes...')
+
+  try:
+    while True:
+      # an unknown set of changes means we need to look at everything, as does
+      # a change to the manifest or ignore file.
+      names = watcher.debounce(wait, args.delay)
+      if names is not None and (manifest_name in names or ignore_name in names):
+        names = None
+
+      # the ignore rules are compiled into the config, so load it again. it's
+      # cached, so this is cheap unless something it's built from changed.
+      if names is None:
+        conf = config.load_config()
+
+      relink(names)
+  except KeyboardInterrupt:
+    print()
+
+def migrate(conf, args):
+  '''
+  Fold every hidden per-file config file into the repo's manifest file, then
+  remove the config files.
+  '''
+
+  manifest = config.load_manifest()
+
+  migrated = []
+  for entry in config.scan_repo(constants.REPO_DIR, conf['ignore']):
+    if entry.config_path is None:
+      continue
+
+    # keep the config as written, so relative paths stay relative. manifest
+    # entries are overlaid on what the name says while config files replace
+    # it, so every key must be written out to keep linking the same.
+    with open(entry.config_path) as f:
+      manifest[os.path.basename(entry.path)] = config.fill_file_config(
+          json.load(f))
+    migrated.append(entry)
+
+  if len(migrated) == 0:
+    print('No config files to migrate')
+    return
+
+  util.write_json(constants.MANIFEST_PATH, manifest)
+
+  for entry in migrated:
+    if not args.keep:
+      util.rm(entry.config_path)
+
+    print(color.cyan(os.path.basename(entry.config_path)), 'migrated to',
+        color.cyan(os.path.basename(constants.MANIFEST_PATH)))
 
 def manage(conf, args):
   '''
@@ -144,50 +409,279 @@ def manage(conf, args):
     files = [color.cyan(os.path.basename(dest_path))]
     if config_file_path:
       files.append(color.cyan(os.path.basename(config_file_path)))
-    files = files.join(' and ')
+    files = ' and '.join(files)
 
     print('Adding', files, 'to the repository...')
 
-    # move us to the current repo directory so all git commands start there
-    os.chdir(constants.REPO_DIR)
+    git = require_git()
 
-    # alert the user if we have uncommitted changes (git exits non-0 in this case)
-    if git.diff(exit_code=True, quiet=True, _ok_code=(0, 1)).exit_code != 0:
+    # alert the user if we have uncommitted changes. untracked files don't
+    # matter, since we only commit our own.
+    if len(gitindex.status(git, untracked=False).modified) > 0:
       raise ValueError('The repository has uncommitted changes - the '
         'newly-managed file will have to be added to the repo manually.')
 
     # add the new files to the staging area
-    git.add(dest_path)
+    paths = [dest_path]
     if config_file_path is not None:
-      git.add(config_file_path)
+      paths.append(config_file_path)
+    git.run('add', '--', *paths)
 
     print('Successfully added', files, 'to the repository')
     print('Committing changes...')
 
     # commit the file to the repository
     commit_message = 'Manage %s' % os.path.basename(args.path)
-    git.commit(m=commit_message, quiet=True)
+    git.run('commit', '--quiet', '-m', commit_message)
 
     print('Commit successful!')
     print('Pushing committed changes...')
 
-    # pull any changes down from upstream, then push our new addition
-    git.pull(rebase=True, quiet=True)
-    git.push(quiet=True)
+    # pull any changes down from upstream, then push our new addition. these may
+    # need to ask for credentials, so they get our terminal.
+    git.run('pull', '--rebase', '--quiet', capture=False)
+    git.run('push', '--quiet', capture=False)
 
     print('Push successful!')
 
 def update(conf, args):
-  '''Apply updates from the upstream repository.'''
+  '''
+  Apply updates from the upstream repository, and remember whether it worked
+  so later runs can report it. With --prefetch, only download them.
+  '''
+
+  if args.prefetch:
+    with require_git() as git:
+      prefetch_updates(git, conf)
+    return
+
+  try:
+    with require_git() as git:
+      heads = update_repo(git, conf, args)
+      if heads is not None:
+        names = changed_entry_names(git, *heads)
+  except Exception:
+    metrics.save_update_result(metrics.FAILED)
+    raise
+
+  if heads is None:
+    metrics.save_update_result(metrics.CURRENT)
+    return
+
+  metrics.save_update_result(metrics.UPDATED)
+
+  # relink only what the update touched. the update may have changed the
+  # config too, so load it again.
+  if names is None or len(names) > 0:
+    print('Linking updated files...')
+    link_entries(config.load_config(), args, names=names)
+
+def changed_entry_names(git, old, new):
+  '''
+  Return the set of names of the repo entries that were added, modified,
+  renamed, or deleted between two commits, counting changes to an entry's
+  hidden config file or anything inside it as changes to the entry. Returns
+  None if something changed that can affect every entry, like the manifest.
+  '''
+
+  # renames are listed as a deletion and an addition, so both names are seen
+  output = git.output('diff', '--name-status', '--no-renames', '-z', old, new)
+  fields = [f for f in output.split('\0') if f != '']
+
+  everything = frozenset([os.path.basename(constants.MANIFEST_PATH),
+      os.path.basename(constants.IGNORE_FILE_PATH)])
+
+  names = set()
+  for path in fields[1::2]:
+    name = path.split('/', 1)[0]
+    if name in everything:
+      return None
+    names.add(util.toggle_hidden(name, False))
+
+  return names
+
+def get_remote_head(git, remote):
+  '''
+  Return the commit hash the given remote's HEAD points to without fetching
+  anything, or None if it doesn't have one.
+  '''
+
+  for line in git.output('ls-remote', remote, 'HEAD').splitlines():
+    fields = line.split()
+    if len(fields) == 2 and fields[1] == 'HEAD':
+      return fields[0]
+
+  return None
+
+def get_updates(git, applied, fetched):
+  '''
+  Return a list of (hash, message) tuples for the commits in fetched that we
+  don't have yet, newest first. Squashed updates never make upstream commits
+  part of our history, so these are the commits since the last update we
+  applied, if there was one, rather than every one we don't have.
+  '''
 
-  print('Checking for updates...')
+  if fetched == applied or fetched == git.resolve('HEAD'):
+    return []
 
-  # fetch changes from the canonical repo
-  git.fetch(constants.GIT_REMOTE, no_tags=True, quiet=True)
+  updates = git.output('--no-pager', 'log', '--oneline',
+      (applied or '') + '..' + fetched)
+  return [tuple(m.split(None, 1)) for m in updates.splitlines()]
 
-  # get a list of the commit messages for the incoming changes
-  updates = git('--no-pager', 'log', '..FETCH_HEAD', oneline=True)
-  updates = [tuple(m.split(None, 1)) for m in updates.splitlines()]
+def format_age(seconds):
+  '''Describe a number of seconds in the largest whole unit that fits.'''
+
+  for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+    if seconds >= size:
+      count = int(seconds // size)
+      return '%d %s%s' % (count, unit, '' if count == 1 else 's')
+
+  return 'moments'
+
+def prefetch_updates(git, conf):
+  '''
+  Download updates from the upstream repository without applying them, and
+  cache a summary of the incoming commits and the paths they change so a
+  later update can apply them without touching the network. Meant to be run
+  regularly in the background.
+
+  Prefetch File Format
+  ----
+
+  ```json
+  {
+    "remote": "https://github.com/jasontbradshaw/dotparty.git",
+    "base": "<the hash of the last update we applied, or null>",
+    "commit": "<the hash of the prefetched commit>",
+    "timestamp": 1400000000.0,
+    "updates": [["<hash>", "<message>"]],
+    "paths": ["changed/path"]
+  }
+  ```
+  '''
+
+  remote = conf.get('update_remote', constants.GIT_REMOTE)
+  applied = git.resolve(constants.UPSTREAM_REF)
+
+  # only download anything if the remote moved since we last prefetched
+  prefetched = git.resolve(constants.PREFETCH_REF)
+  if prefetched is None or get_remote_head(git, remote) != prefetched:
+    git.run('fetch', '--no-tags', '--quiet', remote,
+        '+HEAD:' + constants.PREFETCH_REF, capture=False)
+    prefetched = git.resolve(constants.PREFETCH_REF)
+
+  updates = get_updates(git, applied, prefetched)
+
+  # compare against what we last applied, or where we forked if we never have
+  paths = []
+  if len(updates) > 0:
+    if applied is None:
+      diff_args = ['HEAD...' + prefetched]
+    else:
+      diff_args = [applied, prefetched]
+    output = git.output('diff', '--name-only', '-z', *diff_args)
+    paths = [p for p in output.split('\0') if p != '']
+
+  util.write_json(constants.PREFETCH_PATH, {
+    'remote': remote,
+    'base': applied,
+    'commit': prefetched,
+    'timestamp': time.time(),
+    'updates': updates,
+    'paths': paths,
+  })
+
+  print('Prefetched', len(updates), 'update(s) changing', len(paths),
+      'path(s)')
+
+def load_prefetched(git, conf, applied):
+  '''
+  Return the summary cached by the last prefetch if it's fresh enough to use
+  in place of fetching, and None otherwise. It's only usable if it was fetched
+  from the same remote, after the last update we applied, and is younger than
+  the config's `prefetch_max_age` in seconds. Whatever we find is recorded for
+  --profile.
+  '''
+
+  try:
+    with open(constants.PREFETCH_PATH) as f:
+      prefetched = json.load(f)
+  except (IOError, ValueError):
+    return None
+
+  max_age = conf.get('prefetch_max_age', constants.PREFETCH_MAX_AGE)
+  age = time.time() - prefetched.get('timestamp', 0)
+  usable = (age <= max_age and
+      prefetched.get('remote') == conf.get('update_remote',
+          constants.GIT_REMOTE) and
+      prefetched.get('base') == applied and
+      prefetched.get('commit') is not None and
+      prefetched.get('commit') == git.resolve(constants.PREFETCH_REF))
+
+  timing.record('prefetch', {
+    'age_seconds': age,
+    'max_age_seconds': max_age,
+    'usable': usable,
+    'updates': len(prefetched.get('updates', [])),
+    'paths': len(prefetched.get('paths', [])),
+  })
+
+  if not usable:
+    return None
+  return prefetched
+
+def apply_updates(git, applied, fetched):
+  '''
+  Merge the changes between the upstream commit we last applied and the fetched
+  one into the index and work tree, without committing. Raises a GitError if
+  they conflict with local changes.
+  '''
+
+  if applied is None:
+    # nothing's been applied since the repo was forked, so the fork point is
+    # the right merge base.
+    git.run('merge', '--squash', '--quiet', fetched)
+  else:
+    # our update commits don't record upstream as a parent, so git would pick
+    # the fork point as the base. merging from what we applied instead means
+    # only the new changes are merged.
+    git.run('merge-recursive', applied, '--', 'HEAD', fetched)
+
+def update_repo(git, conf, args):
+  '''
+  Apply updates from the upstream repository using the given git client.
+  Returns a tuple of the commit hashes before and after updating if there were
+  any updates, and None otherwise.
+  '''
+
+  remote = conf.get('update_remote', constants.GIT_REMOTE)
+  applied = git.resolve(constants.UPSTREAM_REF)
+
+  # a fresh prefetch means we don't need the network at all
+  prefetched = load_prefetched(git, conf, applied)
+  if prefetched is not None:
+    print('Using updates checked for',
+        format_age(time.time() - prefetched['timestamp']), 'ago...')
+
+    fetched = prefetched['commit']
+    updates = [tuple(u) for u in prefetched['updates']]
+  else:
+    print('Checking for updates...')
+
+    # ask the remote what it's on before fetching anything. if it's the commit
+    # we last applied, there's nothing to do.
+    if applied is not None and get_remote_head(git, remote) == applied:
+      print('Already up-to-date!')
+      return None
+
+    # fetch changes from the canonical repo
+    git.run('fetch', '--no-tags', '--quiet', remote, capture=False)
+
+    # pin down exactly what we fetched, so we merge the same commits we list
+    fetched = git.resolve('FETCH_HEAD')
+    updates = get_updates(git, applied, fetched)
+
+  log_range = (applied or '') + '..' + fetched
 
   # print out a list of the incoming updates
   if len(updates) > 0:
@@ -200,41 +694,74 @@ def update(conf, args):
     # print a special message if too many updates are available
     if len(updates) > max_updates:
       print('...and', color.green(len(updates) - max_updates), 'more!')
-      print('Run `git log ..FETCH_HEAD` to see the full list')
+      print('Run `git log %s` to see the full list' % log_range)
 
-    # bail if we have uncommitted changes (git exits non-0 in this case)
-    if git.diff(exit_code=True, quiet=True, _ok_code=(0, 1)).exit_code != 0:
+    # bail if we have uncommitted changes, staged or not
+    repo_status = gitindex.status(git)
+    if len(repo_status.modified) > 0:
       raise ValueError('The repository has uncommitted changes. Handle them, '
         'then try updating again.')
 
     print('Applying the update...')
 
-    # stash _all_ changes to the repo
-    git.stash(include_untracked=True, all=True, quiet=True)
-
-    # squash all the fetched commits together and merge them into master
-    git.merge('@{u}', squash=True, quiet=True)
-
-    # add a nice update commit that includes the latest upstream commit hash
-    commit_message = 'Update dotparty to %s' % updates[0][0]
-    git.commit(m=commit_message, quiet=True)
-
-    # TODO: if squash merge failed, roll back to the pre-update state and
-    # complain with instructions for the user to do their own update.
-
-    # un-stash all our old changes
-    git.stash('pop', quiet=True)
+    # stash untracked files so the update can't collide with them, noting
+    # whether anything was actually stashed.
+    stashed = False
+    if len(repo_status.untracked) > 0:
+      stash = git.resolve('refs/stash')
+      git.run('stash', '--include-untracked', '--all', '--quiet')
+      stashed = git.resolve('refs/stash') != stash
+
+    old_head = git.resolve('HEAD')
+    try:
+      apply_updates(git, applied, fetched)
+
+      # repos updated before we recorded what we applied list updates they
+      # already have, so there may be nothing to commit.
+      changed = git.run('diff', '--cached', '--quiet',
+          ok_codes=(0, 1)).exit_code == 1
+
+      # add a nice update commit that includes the latest upstream commit hash
+      if changed:
+        commit_message = 'Update dotparty to %s' % updates[0][0]
+        git.run('commit', '--quiet', '-m', commit_message)
+
+      # remember what we applied, so we can tell when there's nothing new
+      git.run('update-ref', constants.UPSTREAM_REF, fetched)
+    except gitclient.GitError:
+      # roll back to the pre-update state. unlike a hard reset, this only
+      # resets what the update touched, so nothing else can be lost.
+      git.run('reset', '--merge', '--quiet', old_head)
+      raise ValueError('The update conflicts with your changes. Run '
+          '`git diff %s` to see it, and apply it yourself.' % log_range)
+    finally:
+      # un-stash all our old changes
+      if stashed:
+        git.run('stash', 'pop', '--quiet')
+
+    if not changed:
+      print('Already up-to-date!')
+      return None
 
     # push our changes back up to the remote
-    git.push(quiet=True)
+    git.run('push', '--quiet', capture=False)
 
     print('Update successful!')
+    return (old_head, git.resolve('HEAD'))
   else:
+    # we have everything already, so don't fetch again until the remote changes
+    if fetched != applied:
+      git.run('update-ref', constants.UPSTREAM_REF, fetched)
+
     print('Already up-to-date!')
+    return None
 
 def install(conf, args):
   '''Clone a package to the packages directory.'''
 
+  # packages are git repos
+  require_git()
+
   # TODO:
   # - determine whether we're dealing with a repo URL or a github reference
   # - build a URL if we weren't given one
@@ -245,20 +772,36 @@ def install(conf, args):
 def upgrade(conf, args):
   '''Upgrade the specified (or all, by default) packages.'''
 
+  # packages are git repos
+  require_git()
+
   # TODO:
   # - iterate over all packages in the installed list and pull them, updating
   #   them if their folders exist, installing otherwise
 
+def write_reports(args, succeeded):
+  '''Print and write out whichever reports on the run were asked for.'''
+
+  if args.profile:
+    print(timing.format_report(), file=sys.stderr)
+  if args.profile_json is not None:
+    util.write_json(args.profile_json, timing.report())
+  if args.metrics is not None:
+    metrics.write_metrics(args.metrics, args.command.__name__, succeeded)
+
 def main():
   # make sure the user has the correct versions of required software installed
   util.ensure_required_software()
 
   args = arguments.parse()
-  conf = config.load_config()
+  with timing.phase('config'):
+    conf = config.load_config()
 
   # call the subcommand the user specified with the config and arguments
+  succeeded = False
   try:
     args.command(conf, args)
+    succeeded = True
   except Exception as e:
     # raise the full exeption if debug is enabled
     if args.debug:
@@ -267,6 +810,16 @@ def main():
     # if we encounter an exception, print it and exit with an error
     print(color.red('[error]'), e, file=sys.stderr)
     sys.exit(1)
+  finally:
+    # report what happened and where the time went, even if the command failed
+    try:
+      write_reports(args, succeeded)
+    except EnvironmentError as e:
+      if args.debug:
+        raise
+
+      print(color.red('[error]'), e, file=sys.stderr)
+      sys.exit(1)
 
 if __name__ == '__main__':
   main()
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+
+import collections
+import subprocess
+
+import timing
+
+# the result of running a git command to completion
+Result = collections.namedtuple('Result', ['exit_code', 'output', 'error'])
+
+class GitError(Exception):
+  '''Raised when a git command exits with an unexpected code.'''
+
+  def __init__(self, args, result):
+    self.args_list = list(args)
+    self.result = result
+
+    msg = "'git %s' failed with exit code %d" % (' '.join(args),
+        result.exit_code)
+    if result.error:
+      msg += ': ' + result.error.strip()
+
+    super(GitError, self).__init__(msg)
+
+class GitClient(object):
+  '''
+  Run git commands in a repository, counting every process spawned under the
+  'git' timing counter.
+
+  Read-only object queries, like resolving a revision to a commit hash or
+  reading a commit, go through a single long-lived `git cat-file --batch`
+  process that's started the first time it's needed and reused for the rest of
+  the run, so asking many questions only costs one process. Everything else
+  spawns a process per command.
+  '''
+
+  def __init__(self, repo_dir, git_path='git'):
+    self.repo_dir = repo_dir
+    self.git_path = git_path
+    self._batch = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def _spawn(self, args, **kwargs):
+    '''Start a git process with the given arguments in the repo directory.'''
+
+    timing.count('git')
+    return subprocess.Popen([self.git_path] + list(args), cwd=self.repo_dir,
+        **kwargs)
+
+  def run(self, *args, **kwargs):
+    '''
+    Run a git command to completion and return its Result, with its output
+    decoded. Raises a GitError if it exits with a code not in `ok_codes`,
+    which defaults to only 0. If `capture` is False, output goes straight to
+    our own stdout and stderr instead, which is best for commands that may
+    need to prompt for credentials.
+    '''
+
+    ok_codes = kwargs.pop('ok_codes', (0,))
+    capture = kwargs.pop('capture', True)
+
+    pipe = subprocess.PIPE if capture else None
+    with timing.phase('git'):
+      process = self._spawn(args, stdout=pipe, stderr=pipe)
+      output, error = process.communicate()
+
+    result = Result(process.returncode,
+        (output or b'').decode('utf-8', 'replace'),
+        (error or b'').decode('utf-8', 'replace'))
+    if result.exit_code not in ok_codes:
+      raise GitError(args, result)
+
+    return result
+
+  def output(self, *args, **kwargs):
+    '''Run a git command like `run`, and return only its output.'''
+    return self.run(*args, **kwargs).output
+
+  def _batch_process(self):
+    '''Return the shared `cat-file --batch` process, starting it if needed.'''
+
+    if self._batch is None:
+      self._batch = self._spawn(['cat-file', '--batch'],
+          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    return self._batch
+
+  def read_object(self, rev):
+    '''
+    Return a tuple of the hash, type, and raw content of the object the given
+    revision names, or None if there's no such object.
+    '''
+
+    # the batch protocol is line-based, so a revision can't contain a newline
+    if '\n' in rev:
+      raise ValueError('Invalid revision: %r' % rev)
+
+    with timing.phase('git'):
+      process = self._batch_process()
+      process.stdin.write(rev.encode('utf-8') + b'\n')
+      process.stdin.flush()
+
+      # the header is '<hash> <type> <size>', or '<rev> missing'
+      header = process.stdout.readline().decode('utf-8').split()
+      if len(header) != 3:
+        if len(header) == 0:
+          raise GitError(['cat-file', '--batch'], Result(-1, '',
+              'helper exited unexpectedly'))
+        return None
+
+      sha, kind, size = header
+      content = process.stdout.read(int(size))
+
+      # every object is followed by a newline
+      process.stdout.read(1)
+
+    return (sha, kind, content)
+
+  def resolve(self, rev):
+    '''Return the full hash of the object the given revision names, or None.'''
+
+    obj = self.read_object(rev)
+    if obj is None:
+      return None
+    return obj[0]
+
+  def close(self):
+    '''Stop the shared helper process, if it was started.'''
+
+    if self._batch is not None:
+      self._batch.stdin.close()
+      self._batch.wait()
+      self._batch = None
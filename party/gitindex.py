@@ -0,0 +1,386 @@
+from __future__ import unicode_literals
+
+import collections
+import errno
+import os
+import re
+import stat
+import struct
+
+import ignore
+import util
+
+# the fixed-size fields that start every index entry: ctime and mtime as
+# seconds and nanoseconds, dev, ino, mode, uid, gid, and size.
+ENTRY_STAT = struct.Struct('>10I')
+
+# entry flags
+FLAG_ASSUME_VALID = 0x8000
+FLAG_EXTENDED = 0x4000
+FLAG_NAME_MASK = 0x0fff
+
+# extended entry flags, only present in version 3 and later
+FLAG_SKIP_WORKTREE = 0x4000
+FLAG_INTENT_TO_ADD = 0x2000
+
+# extensions that change what the entries mean, and that we don't handle
+UNSUPPORTED_EXTENSIONS = frozenset([b'link', b'sdir'])
+
+# the object format of repos that don't use SHA-1
+SHA256_REGEX = re.compile(br'^\s*objectformat\s*=\s*sha256\s*$',
+    re.IGNORECASE | re.MULTILINE)
+
+# repos on filesystems without an exec bit tell git to ignore it
+NO_FILEMODE_REGEX = re.compile(br'^\s*filemode\s*=\s*(?:false|no|off|0)\s*$',
+    re.IGNORECASE | re.MULTILINE)
+
+# git's entry modes for the kinds of files it tracks
+MODE_SYMLINK = 0o120000
+MODE_GITLINK = 0o160000
+
+# the most paths we'll pass to a single git command to double-check
+MAX_PATHSPECS = 1000
+
+# a single entry in the index, with its path relative to the work tree
+IndexEntry = collections.namedtuple('IndexEntry', ['path', 'ctime', 'mtime',
+    'ino', 'mode', 'uid', 'gid', 'size', 'stage', 'flags', 'extended_flags'])
+
+# the paths that differ between HEAD, the index, and the work tree, and those
+# git doesn't track but doesn't ignore either.
+Status = collections.namedtuple('Status', ['modified', 'untracked'])
+
+class UnsupportedIndex(ValueError):
+  '''Raised for index files we can't read, so git can be asked instead.'''
+
+def _read_varint(data, offset):
+  '''
+  Read one of git's offset-encoded variable-length integers from data, and
+  return a tuple of it and the offset just past it.
+  '''
+
+  byte = ord(data[offset:offset + 1])
+  offset += 1
+  value = byte & 0x7f
+  while byte & 0x80:
+    byte = ord(data[offset:offset + 1])
+    offset += 1
+    value = ((value + 1) << 7) | (byte & 0x7f)
+
+  return (value, offset)
+
+def parse_index(data, hash_size=20):
+  '''
+  Parse the contents of a git index file and return its list of entries.
+  Versions 2 through 4 are supported, but split and sparse indexes aren't,
+  since their entries don't describe the whole work tree. Raises an
+  UnsupportedIndex error for anything we can't read.
+  '''
+
+  if len(data) < 12 or data[:4] != b'DIRC':
+    raise UnsupportedIndex('Not a git index file')
+
+  version, count = struct.unpack('>II', data[4:12])
+  if version not in (2, 3, 4):
+    raise UnsupportedIndex('Unsupported index version %d' % version)
+
+  entries = []
+  offset = 12
+  previous_name = b''
+  end = len(data) - hash_size
+  try:
+    for i in range(count):
+      start = offset
+      fields = ENTRY_STAT.unpack_from(data, offset)
+      offset += ENTRY_STAT.size + hash_size
+
+      flags, = struct.unpack_from('>H', data, offset)
+      offset += 2
+
+      extended_flags = 0
+      if flags & FLAG_EXTENDED:
+        if version < 3:
+          raise UnsupportedIndex('Extended flags in a version 2 index')
+        extended_flags, = struct.unpack_from('>H', data, offset)
+        offset += 2
+
+      if version == 4:
+        # names are stored as how much of the previous name to drop, then the
+        # rest of the name, and entries aren't padded.
+        strip, offset = _read_varint(data, offset)
+        name_end = data.index(b'\0', offset)
+        prefix = previous_name[:len(previous_name) - strip]
+        name = prefix + data[offset:name_end]
+        offset = name_end + 1
+      else:
+        length = flags & FLAG_NAME_MASK
+        if length == FLAG_NAME_MASK:
+          length = data.index(b'\0', offset) - offset
+        name = data[offset:offset + length]
+
+        # entries are padded with 1 to 8 NULs to a multiple of 8 bytes
+        offset = start + ((offset - start + length + 8) & ~7)
+
+      if offset > end:
+        raise UnsupportedIndex('Truncated index file')
+
+      previous_name = name
+      entries.append(IndexEntry(
+        path=name.decode('utf-8'),
+        ctime=fields[0],
+        mtime=fields[2],
+        ino=fields[5],
+        mode=fields[6],
+        uid=fields[7],
+        gid=fields[8],
+        size=fields[9],
+        stage=(flags >> 12) & 0x3,
+        flags=flags,
+        extended_flags=extended_flags,
+      ))
+  except UnsupportedIndex:
+    raise
+  except (struct.error, ValueError, TypeError):
+    raise UnsupportedIndex('Corrupt index file')
+
+  # look for extensions that change the meaning of the entries
+  while offset + 8 <= end:
+    signature = data[offset:offset + 4]
+    size, = struct.unpack_from('>I', data, offset + 4)
+    if signature in UNSUPPORTED_EXTENSIONS:
+      raise UnsupportedIndex('Unsupported index extension %r' % signature)
+    offset += 8 + size
+
+  return entries
+
+def read_config(git_dir):
+  '''Return the raw contents of the given repo's config file, or b'' if none.'''
+
+  try:
+    with open(os.path.join(git_dir, 'config'), 'rb') as f:
+      return f.read()
+  except IOError as e:
+    if e.errno != errno.ENOENT:
+      raise
+
+  return b''
+
+def get_hash_size(config):
+  '''Return the size in bytes of the object hashes a repo's config asks for.'''
+
+  if SHA256_REGEX.search(config) is not None:
+    return 32
+  return 20
+
+def trusts_file_mode(config):
+  '''Return False if a repo's config turns off `core.fileMode`.'''
+  return NO_FILEMODE_REGEX.search(config) is None
+
+def read_index(git_dir, hash_size=20):
+  '''
+  Read the index of the given git directory, and return a tuple of its entries
+  and its modification time. A repo with no index has no entries.
+  '''
+
+  path = os.path.join(git_dir, 'index')
+  try:
+    with open(path, 'rb') as f:
+      mtime = os.fstat(f.fileno()).st_mtime
+      data = f.read()
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return ([], None)
+    raise
+
+  return (parse_index(data, hash_size=hash_size), mtime)
+
+def compare_entry(entry, info, index_mtime, file_mode=True):
+  '''
+  Compare an index entry against the lstat info of its file, like git does
+  before deciding whether it needs to look at the contents. Returns True if the
+  file is certainly modified, False if it certainly isn't, and None if only git
+  can tell, either because its stat data changed or because it changed too
+  close to when the index was written to trust it. If `file_mode` is False,
+  changes to the exec bit are ignored, like git does when `core.fileMode` is.
+  '''
+
+  if info is None:
+    return True
+
+  # a change in the kind of file, or in whether it's executable, is a change
+  if stat.S_IFMT(entry.mode) == MODE_SYMLINK:
+    if not stat.S_ISLNK(info.st_mode):
+      return True
+  elif not stat.S_ISREG(info.st_mode):
+    return True
+  elif file_mode and (entry.mode & 0o100) != (info.st_mode & 0o100):
+    # `core.fileMode` may be turned off outside the repo's own config, so only
+    # git can say whether this matters.
+    return None
+
+  if (entry.mtime != int(info.st_mtime) or
+      entry.ctime != int(info.st_ctime) or
+      entry.ino != info.st_ino & 0xffffffff or
+      entry.uid != info.st_uid or
+      entry.gid != info.st_gid or
+      entry.size != info.st_size & 0xffffffff):
+    return None
+
+  # a file changed in the same second the index was written may have changed
+  # again without its stat data showing it.
+  if index_mtime is None or entry.mtime >= int(index_mtime):
+    return None
+
+  return False
+
+def find_changes(work_tree, entries, index_mtime, file_mode=True):
+  '''
+  Compare every tracked file against the index, and return a tuple of the
+  paths that are certainly modified and those that need their contents
+  checked. `file_mode` is passed on to `compare_entry`.
+  '''
+
+  modified = []
+  suspects = []
+  for entry in entries:
+    # unmerged paths are always modified, and some are deliberately untouched
+    if entry.stage != 0:
+      if entry.path not in modified:
+        modified.append(entry.path)
+      continue
+    if (entry.flags & FLAG_ASSUME_VALID or
+        entry.extended_flags & FLAG_SKIP_WORKTREE):
+      continue
+
+    # submodules and newly-added paths need git's own judgement
+    if (stat.S_IFMT(entry.mode) == MODE_GITLINK or
+        entry.extended_flags & FLAG_INTENT_TO_ADD):
+      suspects.append(entry.path)
+      continue
+
+    try:
+      info = os.lstat(os.path.join(work_tree, entry.path))
+    except OSError as e:
+      if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+        raise
+      info = None
+
+    result = compare_entry(entry, info, index_mtime, file_mode=file_mode)
+    if result is True:
+      modified.append(entry.path)
+    elif result is None:
+      suspects.append(entry.path)
+
+  return (modified, suspects)
+
+def load_excludes(work_tree, git_dir):
+  '''
+  Return a matcher for the repo's top-level `.gitignore` and its
+  `info/exclude` file. Rules from nested `.gitignore` files and the user's
+  global excludes aren't loaded, so this may ignore less than git would, but
+  never more.
+  '''
+
+  lines = []
+  for path in (os.path.join(work_tree, '.gitignore'),
+      os.path.join(git_dir, 'info', 'exclude')):
+    try:
+      with open(path, 'rb') as f:
+        lines.extend(line.decode('utf-8') for line in f)
+    except IOError as e:
+      if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+        raise
+
+  return ignore.IgnoreMatcher([], root=work_tree, lines=lines)
+
+def find_untracked(work_tree, git_dir, tracked):
+  '''
+  Walk the work tree, skipping what its ignore files exclude, and return the
+  paths of files that aren't in the given set of tracked paths.
+  '''
+
+  work_tree = util.normpath(work_tree)
+  excludes = load_excludes(work_tree, git_dir)
+
+  untracked = []
+  for dirpath, dirnames, filenames in excludes.walk(work_tree):
+    if dirpath == work_tree and '.git' in dirnames:
+      dirnames.remove('.git')
+
+    # links to directories are tracked like files, so treat them as such
+    links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+    for name in links:
+      dirnames.remove(name)
+
+    for name in filenames + links:
+      path = os.path.relpath(os.path.join(dirpath, name), work_tree)
+      if path not in tracked:
+        untracked.append(path)
+
+  return untracked
+
+def _git_paths(git, args, paths=None):
+  '''
+  Run a git command that lists NUL-separated paths, limited to the given paths
+  if there are any, and return the paths it lists.
+  '''
+
+  # paths are never patterns
+  args = ['--literal-pathspecs'] + list(args)
+  if paths is not None and len(paths) <= MAX_PATHSPECS:
+    # limiting a huge number of paths costs more than just checking them all
+    args += ['--'] + list(paths)
+
+  return [p for p in git.output(*args).split('\0') if p != '']
+
+def status(git, untracked=True):
+  '''
+  Return the Status of the repo the given GitClient runs in, reading its index
+  and stat-ing its files directly so git itself only needs to run to check
+  the contents of files whose stat data can't be trusted, and to confirm any
+  untracked files we find. Paths staged in the index count as modified too,
+  which git is always asked about. Falls back to asking git for everything if
+  the index is in a format we can't read. If `untracked` is False, untracked
+  files aren't looked for, and the status's `untracked` is None.
+  '''
+
+  work_tree = util.normpath(git.repo_dir)
+  git_dir = os.path.join(work_tree, '.git')
+
+  # linked work trees and submodules have a '.git' file instead
+  entries = None
+  if os.path.isdir(git_dir):
+    repo_config = read_config(git_dir)
+    try:
+      entries, index_mtime = read_index(git_dir,
+          hash_size=get_hash_size(repo_config))
+    except UnsupportedIndex:
+      pass
+
+  others_args = ['ls-files', '--others', '--exclude-standard', '-z']
+
+  # comparing the index to HEAD means comparing trees, which git does best
+  staged = _git_paths(git, ['diff', '--cached', '--name-only', '-z'])
+
+  if entries is None:
+    modified = _git_paths(git, ['diff', '--name-only', '-z'])
+    others = None
+    if untracked:
+      others = _git_paths(git, others_args)
+    return Status(sorted(frozenset(modified + staged)), others)
+
+  modified, suspects = find_changes(work_tree, entries, index_mtime,
+      file_mode=trusts_file_mode(repo_config))
+  modified.extend(staged)
+  if len(suspects) > 0:
+    # git refreshes the stat data of the paths it's given as it compares them,
+    # so files that were only touched aren't reported.
+    modified.extend(_git_paths(git, ['diff', '--name-only', '-z'], suspects))
+
+  others = None
+  if untracked:
+    others = find_untracked(work_tree, git_dir,
+        frozenset(e.path for e in entries))
+    if len(others) > 0:
+      others = _git_paths(git, others_args, others)
+
+  return Status(sorted(frozenset(modified)), others)
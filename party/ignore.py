@@ -0,0 +1,225 @@
+from __future__ import unicode_literals
+
+import collections
+import itertools
+import os
+import re
+
+import util
+
+# characters that make a pattern a glob rather than a literal path
+GLOB_CHARACTERS = frozenset('*?[')
+
+def is_glob(pattern):
+  '''Return True if the given pattern contains any glob characters.'''
+  return any(c in GLOB_CHARACTERS for c in pattern)
+
+def translate(pattern):
+  '''
+  Translate a glob pattern into an equivalent regular expression string. Unlike
+  `fnmatch.translate`, wildcards never match across path separators, just like
+  the globs the shell expands. As in gitignore files, a `**` path component
+  matches any number of directories, and a backslash makes the character after
+  it literal.
+  '''
+
+  result = []
+  i = 0
+  n = len(pattern)
+  while i < n:
+    c = pattern[i]
+    i += 1
+
+    if c == '\\' and i < n:
+      # an escaped character is always literal
+      result.append(re.escape(pattern[i]))
+      i += 1
+    elif c == '*' and pattern[i:i + 1] == '*':
+      # '**' only has its special meaning as a whole path component
+      at_start = i == 1 or pattern[i - 2] == '/'
+      at_end = i + 1 == n or pattern[i + 1] == '/'
+      if at_start and at_end:
+        if i + 1 == n:
+          # a trailing '**' matches everything inside
+          result.append('.*')
+          i += 1
+        else:
+          # a leading or inner '**/' matches zero or more directories
+          result.append('(?:.*/)?')
+          i += 2
+      else:
+        result.append('[^/]*')
+        i += 1
+    elif c == '*':
+      result.append('[^/]*')
+    elif c == '?':
+      result.append('[^/]')
+    elif c == '[':
+      # find the end of the character class, treating a leading ']' or '!]' as
+      # part of the class like the shell does.
+      j = i
+      if j < n and pattern[j] == '!':
+        j += 1
+      if j < n and pattern[j] == ']':
+        j += 1
+      while j < n and pattern[j] != ']':
+        j += 1
+
+      if j >= n:
+        # an unterminated class is just a literal bracket
+        result.append(re.escape(c))
+      else:
+        chars = pattern[i:j].replace('\\', '\\\\')
+        if chars.startswith('!'):
+          chars = '^' + chars[1:]
+        elif chars.startswith('^'):
+          chars = '\\' + chars
+        result.append('[' + chars + ']')
+        i = j + 1
+    else:
+      result.append(re.escape(c))
+
+  return ''.join(result)
+
+# a single parsed gitignore-style rule
+Rule = collections.namedtuple('Rule', ['regex', 'negate', 'dir_only'])
+
+def parse_rule(line, root):
+  '''
+  Parse a single line from a gitignore-style file into a rule that matches
+  normalized absolute paths under root, or None if the line is blank or a
+  comment.
+
+  Patterns follow gitignore's rules: a leading '!' negates the pattern, a
+  trailing '/' only matches directories, a pattern containing a '/' anywhere
+  but the end is anchored to root while any other pattern matches at any depth,
+  and '**' matches any number of directories.
+  '''
+
+  # trailing spaces are ignored unless escaped
+  line = line.rstrip('\n').rstrip('\r')
+  if not line.endswith('\\ '):
+    line = line.rstrip(' ')
+
+  if line == '' or line.startswith('#'):
+    return None
+
+  negate = line.startswith('!')
+  if negate:
+    line = line[1:]
+  elif line.startswith('\\!') or line.startswith('\\#'):
+    line = line[1:]
+
+  dir_only = line.endswith('/')
+  line = line.rstrip('/')
+  if line == '':
+    return None
+
+  # a slash anywhere but the end anchors the pattern to the root
+  anchored = '/' in line
+  line = line.lstrip('/')
+
+  prefix = re.escape(util.normpath(root)) + '/'
+  if not anchored:
+    prefix += '(?:.*/)?'
+
+  return Rule(prefix + translate(line), negate, dir_only)
+
+class IgnoreMatcher(object):
+  '''
+  Match paths against a set of ignore patterns without touching the disk.
+
+  Plain `patterns` are rooted to `root` and always ignore what they match.
+  Literal ones are looked up in a set, and all the globs are combined into a
+  single regular expression. After those come the gitignore-style rules in
+  `lines`, where later rules override earlier ones. Consecutive rules that
+  behave the same way are combined into a single regular expression too, so
+  matching costs about the same no matter how many patterns there are, and
+  works for files created after compiling.
+  '''
+
+  def __init__(self, patterns, root=None, lines=()):
+    self.patterns = list(patterns)
+    self.literals = set()
+    self.root = None if root is None else util.normpath(root)
+
+    # every run is a (regex, negate, dir_only) rule, in priority order
+    self.runs = []
+
+    globs = []
+    for pattern in self.patterns:
+      pattern = util.normalize_to_root(pattern, root)
+      if is_glob(pattern):
+        globs.append(Rule(translate(pattern), False, False))
+      else:
+        self.literals.add(pattern)
+
+    rules = [r for r in (parse_rule(l, root) for l in lines) if r is not None]
+    self._add_runs(globs + rules)
+
+  def _add_runs(self, rules):
+    '''Compile consecutive rules with the same behavior into single runs.'''
+
+    key = lambda r: (r.negate, r.dir_only)
+    for (negate, dir_only), group in itertools.groupby(rules, key):
+      regex = '(?:' + '|'.join(r.regex for r in group) + r')\Z'
+      self.runs.append(Rule(re.compile(regex), negate, dir_only))
+
+  def _match_one(self, path, is_dir):
+    '''Match a single path, ignoring whether any of its parents are ignored.'''
+
+    # the last matching rule wins, so check them from the end
+    for run in reversed(self.runs):
+      if run.regex.match(path) is None:
+        continue
+
+      # only find out whether the path is a directory if a rule that needs to
+      # know matches it, so most paths are never stat-ed.
+      if run.dir_only:
+        if is_dir is None:
+          is_dir = os.path.isdir(path)
+        if not is_dir:
+          continue
+
+      return not run.negate
+
+    return path in self.literals
+
+  def matches(self, path, is_dir=None):
+    '''
+    Return True if the given normalized path is ignored, either directly or
+    because one of its parent directories is. If `is_dir` is None and a rule
+    that only matches directories matches path, the filesystem is checked to
+    see if path is a directory.
+    '''
+
+    # like git, nothing inside an ignored directory can be un-ignored
+    if self.root is not None and path.startswith(self.root + '/'):
+      parent = self.root
+      for part in path[len(self.root) + 1:].split('/')[:-1]:
+        parent = os.path.join(parent, part)
+        if self._match_one(parent, True):
+          return True
+
+    return self._match_one(path, is_dir)
+
+  def __contains__(self, path):
+    return self.matches(path)
+
+  def walk(self, top):
+    '''
+    Like `os.walk`, but skips ignored files and never descends into ignored
+    directories, so whole subtrees can be pruned without visiting them.
+    '''
+
+    top = util.normpath(top)
+    if self.matches(top, True):
+      return
+
+    for dirpath, dirnames, filenames in os.walk(top):
+      dirnames[:] = [d for d in dirnames
+          if not self._match_one(os.path.join(dirpath, d), True)]
+      filenames[:] = [f for f in filenames
+          if not self._match_one(os.path.join(dirpath, f), False)]
+
+      yield dirpath, dirnames, filenames
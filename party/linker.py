@@ -0,0 +1,185 @@
+from __future__ import unicode_literals
+
+import collections
+import errno
+import os
+import stat
+import timeit
+
+import util
+
+# the actions that may be needed to make a destination point at its source
+CREATE = 'create'
+RETARGET = 'retarget'
+OVERWRITE = 'overwrite'
+UNCHANGED = 'unchanged'
+PRUNE = 'prune'
+FAIL = 'fail'
+
+# all the actions in the order we report them, along with their display colors
+# and the past-tense verbs used when summarizing them.
+ACTIONS = (CREATE, RETARGET, OVERWRITE, UNCHANGED, PRUNE, FAIL)
+ACTION_COLORS = {
+  CREATE: 'green',
+  RETARGET: 'cyan',
+  OVERWRITE: 'yellow',
+  UNCHANGED: 'grey',
+  PRUNE: 'magenta',
+  FAIL: 'red',
+}
+ACTION_VERBS = {
+  CREATE: 'created',
+  RETARGET: 'retargeted',
+  OVERWRITE: 'overwritten',
+  UNCHANGED: 'unchanged',
+  PRUNE: 'pruned',
+  FAIL: 'failed',
+}
+
+# a single planned link from a source file in the repo to one of its
+# destinations. `target` is what the link points at, which is the source itself
+# unless it's a rendered template. `error` holds the message for failed steps,
+# and is None otherwise.
+Step = collections.namedtuple('Step',
+    ['src', 'dest', 'target', 'action', 'error'])
+
+def classify(dest, src):
+  '''
+  Determine which action is needed to make dest a link to src. This costs a
+  single lstat, plus a readlink if dest is already a link, and never modifies
+  the filesystem.
+  '''
+
+  try:
+    info = os.lstat(dest)
+  except OSError as e:
+    # a missing destination (or a missing parent directory) needs creating
+    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+      return CREATE
+    raise
+
+  if not stat.S_ISLNK(info.st_mode):
+    return OVERWRITE
+
+  # resolve relative link targets against the directory containing the link
+  target = util.normpath(os.readlink(dest), root=os.path.dirname(dest))
+  if target == util.normpath(src):
+    return UNCHANGED
+
+  return RETARGET
+
+def _map(pool, fn, items):
+  '''Map fn over items in order, using the given thread pool if there is one.'''
+  if pool is None:
+    return [fn(item) for item in items]
+  return pool.map(fn, items)
+
+def _imap(pool, fn, items):
+  '''Like `_map`, but lazily yields each result as soon as it's ready.'''
+  if pool is None:
+    return (fn(item) for item in items)
+  return pool.imap(fn, items)
+
+def _classify_step(step):
+  '''Classify a step's destination, turning filesystem errors into failures.'''
+  try:
+    return step._replace(action=classify(step.dest, step.target))
+  except EnvironmentError as e:
+    return step._replace(action=FAIL, error=unicode(e))
+
+def plan(links, dirs=None, pool=None):
+  '''
+  Given a dict of source paths to their file configs, return a list of steps
+  for every destination, ordered by source path and then destination order.
+  A config's `target`, if it has one, is linked to instead of its source.
+  Destinations are independent, so they're classified concurrently if a thread
+  pool is given.
+
+  If `dirs` is a set, the parent directory of every existing destination is
+  added to it, since those are known not to need creating.
+  '''
+
+  steps = []
+  for src in sorted(links.keys()):
+    target = links[src].get('target', src)
+    for dest in links[src]['paths']:
+      steps.append(Step(src, dest, target, None, None))
+
+  steps = _map(pool, _classify_step, steps)
+
+  if dirs is not None:
+    for step in steps:
+      if step.action not in (CREATE, FAIL):
+        dirs.add(os.path.dirname(step.dest))
+
+  return steps
+
+def find_stale(entries, links, pool=None):
+  '''
+  Given the entries recorded in a previous run's state and a dict of source
+  paths to their current file configs, return prune steps for every previously
+  created destination that's no longer wanted. Destinations that no longer
+  point at their recorded source (or target) are left alone, since they're not
+  ours anymore.
+  '''
+
+  candidates = []
+  for src in sorted(entries.keys()):
+    wanted = frozenset(links[src]['paths'] if src in links else [])
+    target = entries[src].get('target') or src
+    for dest in entries[src]['paths']:
+      if dest not in wanted:
+        candidates.append(Step(src, dest, target, None, None))
+
+  steps = []
+  for step in _map(pool, _classify_step, candidates):
+    if step.action == UNCHANGED:
+      steps.append(step._replace(action=PRUNE))
+    elif step.action == FAIL:
+      steps.append(step)
+
+  return steps
+
+def apply_iter(steps, overwrite=None, dirs=None, pool=None):
+  '''
+  Execute the given steps, skipping any that are already correct, and yield a
+  tuple of each one and the seconds it took as soon as it's done, in the same
+  order they were given. Steps that fail are yielded as failures rather than
+  aborting the rest, and are run concurrently if a thread pool is given.
+
+  `overwrite` has the same meaning as it does for `util.symlink`, and `dirs` is
+  a set of directories known to exist, usually the one populated by `plan`.
+  '''
+
+  def apply_step(step):
+    start = timeit.default_timer()
+    try:
+      if step.action == PRUNE:
+        util.rm(step.dest)
+      elif step.action not in (UNCHANGED, FAIL):
+        util.symlink(step.dest, step.target, overwrite=overwrite, dirs=dirs)
+    except EnvironmentError as e:
+      step = step._replace(action=FAIL, error=unicode(e))
+
+    return (step, timeit.default_timer() - start)
+
+  return _imap(pool, apply_step, steps)
+
+def apply(steps, overwrite=None, dirs=None, pool=None):
+  '''Like `apply_iter`, but return a list of the applied steps once all are done.'''
+  return [step for step, seconds in apply_iter(steps, overwrite=overwrite,
+      dirs=dirs, pool=pool)]
+
+def count(steps):
+  '''Return a dict mapping every action to the number of steps that use it.'''
+
+  counts = dict((action, 0) for action in ACTIONS)
+  for step in steps:
+    counts[step.action] += 1
+
+  return counts
+
+def summarize(counts):
+  '''Build a human-readable summary of some action counts.'''
+  return ', '.join('%d %s' % (counts[action], ACTION_VERBS[action])
+      for action in ACTIONS)
@@ -0,0 +1,167 @@
+from __future__ import unicode_literals
+
+import json
+import re
+import time
+
+import constants
+import linker
+import timing
+import util
+
+# the prefix of every metric we write
+PREFIX = 'dotparty_'
+
+# the possible results of an update
+UPDATED = 'updated'
+CURRENT = 'current'
+FAILED = 'failed'
+UPDATE_RESULTS = (UPDATED, CURRENT, FAILED)
+
+# characters that must be escaped in label values
+LABEL_ESCAPE_REGEX = re.compile(r'[\\"\n]')
+
+def save_update_result(result, path=constants.UPDATE_RESULT_PATH):
+  '''
+  Remember the result of an update, so every later run can report it. Failing to
+  write it is ignored, since it's only used for reporting.
+  '''
+
+  try:
+    util.write_json(path, {'result': result, 'timestamp': time.time()})
+  except EnvironmentError:
+    pass
+
+def load_update_result(path=constants.UPDATE_RESULT_PATH):
+  '''
+  Return a dict of the result and timestamp of the last update, or None if
+  we've never recorded one.
+  '''
+
+  try:
+    with open(path) as f:
+      loaded = json.load(f)
+  except (IOError, ValueError):
+    return None
+
+  if loaded.get('result') not in UPDATE_RESULTS:
+    return None
+
+  return loaded
+
+def escape_label(value):
+  '''Escape a label value for the OpenMetrics text format.'''
+
+  escapes = {'\\': '\\\\', '"': '\\"', '\n': '\\n'}
+  return LABEL_ESCAPE_REGEX.sub(lambda m: escapes[m.group(0)], value)
+
+def format_value(value):
+  '''Format a sample value, avoiding exponents for integers.'''
+
+  if isinstance(value, bool):
+    return '1' if value else '0'
+  if isinstance(value, (int, long)):
+    return '%d' % value
+  return repr(float(value))
+
+class MetricFamily(object):
+  '''A named gauge, and its samples in the order they were added.'''
+
+  def __init__(self, name, help_text):
+    self.name = PREFIX + name
+    self.help_text = help_text
+    self.samples = []
+
+  def add(self, value, **labels):
+    self.samples.append((labels, value))
+    return self
+
+  def lines(self):
+    yield '# HELP %s %s' % (self.name, self.help_text)
+    yield '# TYPE %s gauge' % self.name
+
+    for labels, value in self.samples:
+      label_text = ''
+      if len(labels) > 0:
+        label_text = '{%s}' % ','.join('%s="%s"' % (k, escape_label(labels[k]))
+            for k in sorted(labels.keys()))
+      yield '%s%s %s' % (self.name, label_text, format_value(value))
+
+def collect(command, succeeded, report, update_result, now):
+  '''
+  Build the list of metric families describing a run of the named command from
+  a `timing` report and the last update result, leaving out any the run didn't
+  produce.
+  '''
+
+  families = []
+
+  families.append(MetricFamily('last_run_timestamp_seconds',
+      'When dotparty last ran a command, as a Unix timestamp.')
+      .add(now, command=command))
+  families.append(MetricFamily('last_run_success',
+      'Whether the last command completed without error.')
+      .add(succeeded, command=command))
+
+  counts = report['values'].get('links')
+  if counts is not None:
+    family = MetricFamily('link_destinations',
+        'Destinations handled by the last link, by action taken.')
+    for action in linker.ACTIONS:
+      family.add(counts.get(action, 0), action=linker.ACTION_VERBS[action])
+    families.append(family)
+
+  ignored = report['values'].get('ignored_entries')
+  if ignored is not None:
+    families.append(MetricFamily('ignored_entries',
+        'Repo entries skipped by the last scan because they were ignored.')
+        .add(ignored))
+
+  if len(report['phases']) > 0:
+    family = MetricFamily('phase_seconds',
+        'Wall time spent in each phase of the last command.')
+    for phase in report['phases']:
+      family.add(phase['seconds'], phase=phase['name'])
+    families.append(family)
+
+  families.append(MetricFamily('git_subprocesses',
+      'Git processes spawned by the last command.')
+      .add(report['counters'].get('git', 0)))
+
+  prefetch = report['values'].get('prefetch')
+  if prefetch is not None:
+    families.append(MetricFamily('prefetch_age_seconds',
+        'How old the prefetched updates were when the last update ran.')
+        .add(prefetch['age_seconds']))
+    families.append(MetricFamily('prefetch_usable',
+        'Whether the last update could apply prefetched updates.')
+        .add(prefetch['usable']))
+
+  if update_result is not None:
+    family = MetricFamily('last_update_result',
+        'The result of the last update, 1 for the result it had.')
+    for result in UPDATE_RESULTS:
+      family.add(update_result['result'] == result, result=result)
+    families.append(family)
+
+    families.append(MetricFamily('last_update_timestamp_seconds',
+        'When the last update finished, as a Unix timestamp.')
+        .add(update_result['timestamp']))
+
+  return families
+
+def write_metrics(path, command, succeeded):
+  '''
+  Atomically write the metrics for this run of the named command to path in
+  the OpenMetrics text format, suitable for node_exporter's textfile collector.
+  '''
+
+  families = collect(command, succeeded, timing.report(),
+      load_update_result(), time.time())
+
+  lines = []
+  for family in families:
+    lines.extend(family.lines())
+  lines.append('# EOF')
+
+  util.write_file(path, '\n'.join(lines) + '\n')
@@ -0,0 +1,116 @@
+from __future__ import unicode_literals
+
+import errno
+import json
+import os
+
+import constants
+import util
+
+# bumped whenever the state file format changes incompatibly
+STATE_VERSION = 2
+
+def signature(path):
+  '''
+  Return a cheap signature of the given path's modification time and inode, or
+  None if it doesn't exist. Used to tell whether a repo entry changed since the
+  last time we linked it.
+  '''
+
+  try:
+    info = os.lstat(path)
+  except OSError as e:
+    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+      return None
+    raise
+
+  return [info.st_mtime, info.st_ino]
+
+def new_state(context):
+  '''
+  Return an empty state for the given context, a dict of everything outside
+  the repo entries themselves that affects how they're linked, like the machine
+  id and destination directory.
+  '''
+
+  return {
+    'version': STATE_VERSION,
+    'context': context,
+    'entries': {},
+  }
+
+def load_state(context, path=constants.LINK_STATE_PATH):
+  '''
+  Load the link state recorded by the last run. If there's no state file, or
+  it was written for a different format version, returns an empty state
+  instead. If it was written for a different context, every entry is marked as
+  changed.
+
+  State File Format
+  ----
+
+  ```json
+  {
+    "version": 2,
+    "context": {
+      "machine_id": "machineid1",
+      "destination": "/home/user"
+    },
+    "entries": {
+      "/path/to/repo/entry": {
+        "signature": [1400000000.0, 123456],
+        "config_signature": null,
+        "paths": ["/home/user/.entry"]
+      }
+    }
+  }
+  ```
+  '''
+
+  state = new_state(context)
+
+  try:
+    with open(path) as f:
+      loaded = json.load(f)
+  except IOError as e:
+    if e.errno == errno.ENOENT:
+      return state
+    raise
+  except ValueError:
+    # a corrupt state file is no worse than a missing one
+    return state
+
+  if loaded.get('version') != STATE_VERSION:
+    return state
+
+  # only trust the signatures if the state describes the same kind of run we're
+  # doing. the recorded links are kept either way so stale ones can be pruned.
+  state['entries'] = loaded.get('entries', {})
+  if loaded.get('context') != context:
+    for entry in state['entries'].itervalues():
+      entry['signature'] = None
+
+  return state
+
+def save_state(state, path=constants.LINK_STATE_PATH):
+  '''
+  Write the given state to disk, atomically replacing any existing state file
+  so an interrupted run can never leave a half-written one behind.
+  '''
+
+  util.write_json(path, state)
+
+def is_current(entry, sig, config_sig):
+  '''
+  Return True if a state entry was recorded with the given signatures, and the
+  render it links to still exists if it's a template. Renders live in a cache
+  that's safe to delete, so a missing one means rendering again.
+  '''
+
+  if (entry is None or
+      entry.get('signature') != sig or
+      entry.get('config_signature') != config_sig):
+    return False
+
+  target = entry.get('target')
+  return target is None or os.path.exists(target)
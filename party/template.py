@@ -0,0 +1,178 @@
+from __future__ import unicode_literals
+
+import getpass
+import hashlib
+import os
+import re
+
+import constants
+import util
+
+# the number of hex digits of a render's key used in its file name
+RENDER_KEY_LENGTH = 16
+RENDER_KEY_REGEX = re.compile(r'[0-9a-f]{%d}\Z' % RENDER_KEY_LENGTH)
+
+# matches variable references like '{{ name }}' in templates
+VARIABLE_REGEX = re.compile(r'\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}')
+
+def get_variables(conf):
+  '''
+  Build the variables templates are rendered with on this machine. Built-in
+  variables come first, then the config's `variables`, then the entries in
+  its `machine_variables` for every name the machine goes by. Groups and tags
+  are applied in sorted order, and the machine id is applied last, since it's
+  the most specific.
+
+  Config Format
+  ----
+
+  ```json
+  {
+    "variables": {
+      "email": "me@example.com"
+    },
+
+    "machine_variables": {
+      "work": {
+        "email": "me@work.example.com"
+      }
+    }
+  }
+  ```
+  '''
+
+  variables = {
+    'machine_id': conf['machine_id'],
+    'home': util.normpath('~'),
+    'user': getpass.getuser(),
+  }
+  variables.update(conf.get('variables', {}))
+
+  machine_variables = conf.get('machine_variables', {})
+  names = sorted(n for n in conf['machine_names'] if n != conf['machine_id'])
+  names.append(conf['machine_id'])
+  for name in names:
+    variables.update(machine_variables.get(name, {}))
+
+  return variables
+
+def render(text, variables):
+  '''
+  Replace every variable reference in the given text with its value. Raises a
+  ValueError if a referenced variable isn't defined.
+  '''
+
+  def replace(match):
+    name = match.group(1)
+    if name not in variables:
+      raise ValueError("Undefined template variable '%s'" % name)
+    return unicode(variables[name])
+
+  return VARIABLE_REGEX.sub(replace, text)
+
+def get_render_path(src, content, variables,
+    render_dir=constants.RENDER_DIR):
+  '''
+  Return the path the given template content renders to. The path is keyed on
+  both the content and the variables, so a rendered file never needs
+  rewriting: if either changes, so does the path.
+  '''
+
+  content_hash = hashlib.sha1(content).hexdigest()
+  key = content_hash + util.fingerprint(variables)
+  key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+  return os.path.join(render_dir, '%s.%s' % (os.path.basename(src),
+      key[:RENDER_KEY_LENGTH]))
+
+def render_file(src, variables, render_dir=constants.RENDER_DIR, write=True):
+  '''
+  Render the template at src with the given variables, and return a tuple of
+  the rendered file's path and whether it had to be rendered. If a render for
+  the same content and variables already exists, nothing is rendered or
+  written. If `write` is False, only the path is computed.
+
+  Once a new render is written, older renders of the same template are removed.
+  '''
+
+  if os.path.isdir(src):
+    raise ValueError("Can't render '%s', since it's a directory" % src)
+
+  with open(src, 'rb') as f:
+    content = f.read()
+
+  path = get_render_path(src, content, variables, render_dir=render_dir)
+  if not write or os.path.exists(path):
+    return (path, False)
+
+  rendered = render(content.decode('utf-8'), variables)
+
+  # write the render off to the side so a partial one can never be linked to,
+  # and give it the same permissions as its template.
+  util.mkdir(render_dir)
+  tmp_path = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    with open(tmp_path, 'wb') as f:
+      f.write(rendered.encode('utf-8'))
+    os.chmod(tmp_path, os.stat(src).st_mode & 0o7777)
+    os.rename(tmp_path, path)
+  except:
+    util.rm(tmp_path)
+    raise
+
+  # clean up renders of earlier versions of this template
+  prefix = os.path.basename(src) + '.'
+  for name in os.listdir(render_dir):
+    old_path = os.path.join(render_dir, name)
+    key = name[len(prefix):]
+    if (name.startswith(prefix) and old_path != path and
+        RENDER_KEY_REGEX.match(key) is not None):
+      util.rm(old_path)
+
+  return (path, True)
+
+def _render_job(job):
+  '''
+  Render a single (src, variables, render_dir, write) job, and return a tuple
+  of src, the rendered path, and an error message, one of which is None. Lives
+  at the top level so process pools can pickle it.
+  '''
+
+  src, variables, render_dir, write = job
+  try:
+    path = render_file(src, variables, render_dir=render_dir, write=write)[0]
+  except (ValueError, EnvironmentError) as e:
+    return (src, None, unicode(e))
+
+  return (src, path, None)
+
+def render_files(srcs, variables, render_dir=constants.RENDER_DIR, write=True,
+    processes=None):
+  '''
+  Render every template in srcs with the same variables, and yield a tuple of
+  each one's source, rendered path, and error message (one of which is None) in
+  the order they were given. Rendering is CPU-bound, so when there's more than
+  one template they're spread across a pool of `processes` processes, one per
+  core by default, and results are yielded as soon as they're ready.
+  '''
+
+  jobs = [(src, variables, render_dir, write) for src in srcs]
+
+  # most runs have few or no templates, so don't pay to import this unless
+  # there's more than one to render.
+  if processes is None and len(jobs) >= 2:
+    import multiprocessing
+    processes = multiprocessing.cpu_count()
+
+  if processes is None or min(processes, len(jobs)) < 2:
+    for job in jobs:
+      yield _render_job(job)
+    return
+
+  import multiprocessing
+  pool = multiprocessing.Pool(min(processes, len(jobs)))
+  try:
+    for result in pool.imap(_render_job, jobs):
+      yield result
+  finally:
+    pool.close()
+    pool.join()
@@ -0,0 +1,114 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+
+import gitclient
+import gitindex
+
+class StatusTest(unittest.TestCase):
+  '''Compare `gitindex.status` against `git status` in a scratch repository.'''
+
+  def setUp(self):
+    self.repo = tempfile.mkdtemp()
+    self.env = dict(os.environ,
+        GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+        GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+
+    self.git('init', '--quiet')
+    self.git('config', 'core.filemode', 'true')
+    os.mkdir(os.path.join(self.repo, 'sub'))
+    self.write('.gitignore', '*.log\n')
+    for name in ('edited', 'deleted', 'chmoded', 'staged', 'unstaged',
+        'sub/nested', 'sub/same'):
+      self.write(name, name + '\n')
+    self.git('add', '--all')
+    self.git('commit', '--quiet', '-m', 'init')
+
+  def tearDown(self):
+    shutil.rmtree(self.repo)
+
+  def write(self, name, text):
+    with open(os.path.join(self.repo, name), 'w') as f:
+      f.write(text)
+
+  def git(self, *args):
+    return subprocess.check_output(('git',) + args, cwd=self.repo,
+        env=self.env).decode('utf-8')
+
+  def make_changes(self, version):
+    # an extended flag, which only version 3 and later can hold
+    if version >= 3:
+      self.git('update-index', '--skip-worktree', 'sub/same')
+      self.write('sub/same', 'skipped\n')
+
+    self.write('edited', 'changed\n')
+    self.write('sub/nested', 'same size\n')
+    os.remove(os.path.join(self.repo, 'deleted'))
+    os.chmod(os.path.join(self.repo, 'chmoded'), 0o755)
+    self.write('staged', 'staged\n')
+    self.git('add', 'staged')
+    self.git('rm', '--quiet', '--cached', 'unstaged')
+    self.write('new', 'new\n')
+    self.write('sub/new', 'new\n')
+    self.write('ignored.log', 'ignored\n')
+
+  def expected(self):
+    '''Return the modified and untracked paths `git status` reports.'''
+
+    modified = set()
+    untracked = set()
+    output = self.git('status', '--porcelain', '-z', '--untracked-files=all')
+    for line in output.split('\0'):
+      if line == '':
+        continue
+      if line.startswith('??'):
+        untracked.add(line[3:])
+      else:
+        modified.add(line[3:])
+
+    return (modified, untracked)
+
+  def status(self):
+    with gitclient.GitClient(self.repo) as git:
+      result = gitindex.status(git)
+    return (set(result.modified), set(result.untracked))
+
+  def index_version(self):
+    with open(os.path.join(self.repo, '.git', 'index'), 'rb') as f:
+      return struct.unpack('>I', f.read(8)[4:])[0]
+
+  def check_version(self, version):
+    self.make_changes(version)
+    self.git('update-index', '--index-version', str(version))
+    self.assertEqual(self.index_version(), version)
+
+    self.assertEqual(self.status(), self.expected())
+    self.assertIn('chmoded', self.status()[0])
+    self.assertIn('unstaged', self.status()[1])
+
+  def test_index_version_2(self):
+    self.check_version(2)
+
+  def test_index_version_3(self):
+    self.check_version(3)
+
+  def test_index_version_4(self):
+    self.check_version(4)
+
+  def test_clean(self):
+    self.assertEqual(self.status(), (set(), set()))
+
+  def test_file_mode_off(self):
+    self.git('config', 'core.filemode', 'false')
+    os.chmod(os.path.join(self.repo, 'chmoded'), 0o755)
+
+    self.assertEqual(self.expected(), (set(), set()))
+    self.assertEqual(self.status(), (set(), set()))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,180 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import ignore
+import util
+
+# a root that's never touched, since every case says whether it's a directory
+ROOT = '/repo'
+
+# tuples of gitignore-style lines, a path relative to the root, whether it's a
+# directory, and whether it should be ignored.
+RULE_CASES = [
+  # blank lines and comments never match
+  ([''], 'a', False, False),
+  (['#a'], '#a', False, False),
+  (['   '], '   ', False, False),
+
+  # patterns without a slash match at any depth
+  (['*.log'], 'a.log', False, True),
+  (['*.log'], 'sub/dir/a.log', False, True),
+  (['*.log'], 'a.logs', False, False),
+  (['a'], 'sub/a', False, True),
+
+  # a slash at the start or in the middle anchors to the root
+  (['/top'], 'top', False, True),
+  (['/top'], 'sub/top', False, False),
+  (['sub/a'], 'sub/a', False, True),
+  (['sub/a'], 'other/sub/a', False, False),
+
+  # wildcards never match a slash
+  (['a*b'], 'axyb', False, True),
+  (['/a*b'], 'ax/yb', False, False),
+  (['?.c'], 'a.c', False, True),
+  (['?.c'], 'ab.c', False, False),
+
+  # character classes, negated with '!'
+  (['[abc].c'], 'b.c', False, True),
+  (['[abc].c'], 'd.c', False, False),
+  (['[!abc].c'], 'd.c', False, True),
+  (['[!abc].c'], 'a.c', False, False),
+  (['[a'], '[a', False, True),
+
+  # '**' matches any number of directories as a whole component
+  (['**/foo'], 'foo', False, True),
+  (['**/foo'], 'a/b/foo', False, True),
+  (['a/**/b'], 'a/b', False, True),
+  (['a/**/b'], 'a/x/y/b', False, True),
+  (['a/**/b'], 'a/xb', False, False),
+  (['a/**'], 'a/x/y', False, True),
+  (['a/**'], 'a', True, False),
+  (['a**b'], 'axyb', False, True),
+  (['/a**b'], 'ax/yb', False, False),
+
+  # the last matching rule wins
+  (['*.txt', '!keep.txt'], 'keep.txt', False, False),
+  (['*.txt', '!keep.txt'], 'other.txt', False, True),
+  (['!keep.txt', '*.txt'], 'keep.txt', False, True),
+
+  # a trailing slash only matches directories, and everything inside them
+  (['build/'], 'build', True, True),
+  (['build/'], 'build', False, False),
+  (['build/'], 'build/out', False, True),
+  (['build/'], 'sub/build', True, True),
+
+  # nothing inside an ignored directory can be re-included
+  (['build/', '!build/keep'], 'build/keep', False, True),
+  (['sub', '!sub/keep'], 'sub/keep', False, True),
+
+  # backslashes make the next character literal
+  (['\\#a'], '#a', False, True),
+  (['\\!a'], '!a', False, True),
+  (['\\!a'], 'a', False, False),
+  (['\\*'], '*', False, True),
+  (['\\*'], 'a', False, False),
+  (['\\[ab]'], '[ab]', False, True),
+  (['\\[ab]'], 'a', False, False),
+  (['a\\?'], 'a?', False, True),
+  (['a\\?'], 'ab', False, False),
+
+  # trailing spaces are dropped unless escaped
+  (['a  '], 'a', False, True),
+  (['a\\ '], 'a ', False, True),
+  (['a\\ '], 'a', False, False),
+  (['a\r\n'], 'a', False, True),
+]
+
+# tuples of plain patterns, a path relative to the root, whether it's a
+# directory, and whether it should be ignored.
+PATTERN_CASES = [
+  (['party'], 'party', True, True),
+  (['party'], 'party/x', False, True),
+  (['party'], 'sub/party', False, False),
+  (['*.md'], 'README.md', False, True),
+  (['*.md'], 'sub/README.md', False, False),
+  (['/elsewhere/*'], 'a', False, False),
+]
+
+class IgnoreMatcherTest(unittest.TestCase):
+  '''Match paths against gitignore-style rules and plain patterns.'''
+
+  def check(self, matcher, case):
+    lines, path, is_dir, expected = case
+    full_path = os.path.join(ROOT, path)
+    self.assertEqual(matcher.matches(full_path, is_dir), expected,
+        '%r against %r (is_dir=%r)' % (lines, path, is_dir))
+
+  def test_rules(self):
+    for case in RULE_CASES:
+      self.check(ignore.IgnoreMatcher([], root=ROOT, lines=case[0]), case)
+
+  def test_patterns(self):
+    for case in PATTERN_CASES:
+      self.check(ignore.IgnoreMatcher(case[0], root=ROOT), case)
+
+  def test_patterns_before_rules(self):
+    matcher = ignore.IgnoreMatcher(['*.md'], root=ROOT, lines=['!README.md'])
+    self.assertFalse(matcher.matches(os.path.join(ROOT, 'README.md'), False))
+    self.assertTrue(matcher.matches(os.path.join(ROOT, 'OTHER.md'), False))
+
+  def test_is_glob(self):
+    self.assertTrue(ignore.is_glob('*.md'))
+    self.assertTrue(ignore.is_glob('a?'))
+    self.assertTrue(ignore.is_glob('[ab]'))
+    self.assertFalse(ignore.is_glob('party'))
+
+class WalkTest(unittest.TestCase):
+  '''Walk a scratch directory tree, skipping what's ignored.'''
+
+  def setUp(self):
+    self.root = util.normpath(tempfile.mkdtemp())
+    for path in ('keep.txt', 'a.log', 'build/out', 'sub/a.log', 'sub/keep.txt',
+        'sub/deep/x', 'sub/build/y', 'only/keep'):
+      path = os.path.join(self.root, path)
+      util.mkdir(os.path.dirname(path))
+      with open(path, 'w') as f:
+        f.write('x\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def walk(self, lines, top=None):
+    '''Return the set of files walked, relative to the root.'''
+
+    matcher = ignore.IgnoreMatcher([], root=self.root, lines=lines)
+    walked = set()
+    for dirpath, dirnames, filenames in matcher.walk(top or self.root):
+      for name in filenames:
+        walked.add(os.path.relpath(os.path.join(dirpath, name), self.root))
+    return walked
+
+  def test_nothing_ignored(self):
+    self.assertEqual(len(self.walk([])), 8)
+
+  def test_ignored_files_and_directories(self):
+    self.assertEqual(self.walk(['*.log', 'build/', 'deep']), set([
+      'keep.txt',
+      os.path.join('sub', 'keep.txt'),
+      os.path.join('only', 'keep'),
+    ]))
+
+  def test_no_reinclude_in_ignored_directory(self):
+    self.assertEqual(self.walk(['sub/', '!sub/keep.txt', '/only/']),
+        set(['keep.txt', 'a.log', os.path.join('build', 'out')]))
+
+  def test_negation(self):
+    self.assertEqual(self.walk(['*', '!*/', '!keep.txt']), set([
+      'keep.txt',
+      os.path.join('sub', 'keep.txt'),
+    ]))
+
+  def test_ignored_top(self):
+    self.assertEqual(self.walk(['sub/'], os.path.join(self.root, 'sub')),
+        set())
+
+if __name__ == '__main__':
+  unittest.main()
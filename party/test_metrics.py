@@ -0,0 +1,42 @@
+from __future__ import unicode_literals
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import metrics
+
+class WriteMetricsTest(unittest.TestCase):
+  '''Write metrics files the way `--metrics` does.'''
+
+  def setUp(self):
+    self.cwd = os.getcwd()
+    self.root = tempfile.mkdtemp()
+    os.chdir(self.root)
+
+  def tearDown(self):
+    os.chdir(self.cwd)
+    shutil.rmtree(self.root)
+
+  def read(self, path):
+    with io.open(path, encoding='utf-8') as f:
+      return f.read()
+
+  def test_bare_file_name(self):
+    metrics.write_metrics('m.prom', 'link', True)
+
+    text = self.read('m.prom')
+    self.assertIn('dotparty_last_run_success{command="link"} 1\n', text)
+    self.assertTrue(text.endswith('# EOF\n'))
+    self.assertEqual(os.listdir('.'), ['m.prom'])
+
+  def test_missing_directory(self):
+    metrics.write_metrics(os.path.join('metrics', 'm.prom'), 'link', False)
+
+    text = self.read(os.path.join('metrics', 'm.prom'))
+    self.assertIn('dotparty_last_run_success{command="link"} 0\n', text)
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,68 @@
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# this directory, which gets copied into every repo we migrate
+PARTY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class MigrateTest(unittest.TestCase):
+  '''
+  Run `dotparty migrate` in a scratch repo with its own home directory, and
+  check that everything links the same way afterwards.
+  '''
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.repo = os.path.join(self.root, 'repo')
+    self.home = os.path.join(self.root, 'home')
+    os.mkdir(self.home)
+    shutil.copytree(PARTY_DIR, os.path.join(self.repo, 'party'),
+        ignore=shutil.ignore_patterns('*.pyc'))
+
+    self.env = dict(os.environ, HOME=self.home)
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def write(self, name, text):
+    with open(os.path.join(self.repo, name), 'w') as f:
+      f.write(text)
+
+  def run_party(self, *args):
+    '''Run dotparty in the repo, and return its output.'''
+    return subprocess.check_output(
+        (sys.executable, os.path.join('party', 'dotparty.py')) + args,
+        cwd=self.repo, env=self.env).decode('utf-8')
+
+  def planned_links(self):
+    '''Return the set of destinations a dry-run link would create.'''
+
+    output = self.run_party('link', '--test', '--format', 'jsonl')
+    records = [json.loads(line) for line in output.splitlines()]
+    return set(r['dest'] for r in records if r['action'] == 'create')
+
+  def test_links_unchanged(self):
+    # config files replace everything the name says, including its machines
+    self.write('foo@other', 'foo\n')
+    self.write('.foo@other', '{"paths": ["foo"]}')
+    self.write('_bar', 'bar\n')
+    self.write('._bar', '{"machines": ["other"]}')
+    self.write('baz@other', 'baz\n')
+    self.write('.baz@other', '{"paths": ["baz"], "template": true}')
+
+    before = self.planned_links()
+    self.assertEqual(before, set([os.path.join(self.home, 'foo'),
+        os.path.join(self.home, 'baz')]))
+
+    self.run_party('migrate')
+    self.assertFalse(os.path.exists(os.path.join(self.repo, '.foo@other')))
+    self.assertEqual(self.planned_links(), before)
+
+if __name__ == '__main__':
+  unittest.main()
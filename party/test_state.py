@@ -0,0 +1,45 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import state
+
+class IsCurrentTest(unittest.TestCase):
+  '''Decide whether recorded entries can be skipped.'''
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.render = os.path.join(self.root, 'tmpl.render')
+    with open(self.render, 'w') as f:
+      f.write('rendered\n')
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def entry(self, **extra):
+    recorded = {'signature': [1, 2], 'config_signature': None, 'paths': []}
+    recorded.update(extra)
+    return recorded
+
+  def test_same_signatures(self):
+    self.assertTrue(state.is_current(self.entry(), [1, 2], None))
+
+  def test_changed_signatures(self):
+    self.assertFalse(state.is_current(None, [1, 2], None))
+    self.assertFalse(state.is_current(self.entry(), [1, 3], None))
+    self.assertFalse(state.is_current(self.entry(), [1, 2], [3, 4]))
+
+  def test_render_exists(self):
+    entry = self.entry(target=self.render)
+    self.assertTrue(state.is_current(entry, [1, 2], None))
+
+  def test_render_missing(self):
+    entry = self.entry(target=self.render)
+    os.remove(self.render)
+    self.assertFalse(state.is_current(entry, [1, 2], None))
+
+if __name__ == '__main__':
+  unittest.main()
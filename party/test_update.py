@@ -0,0 +1,150 @@
+from __future__ import unicode_literals
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import constants
+
+# this directory, which gets copied into every repo we update
+PARTY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+class UpdateTest(unittest.TestCase):
+  '''
+  Run `dotparty update` in a clone of a local upstream repository, with its own
+  home directory and a bare repository standing in for the user's remote.
+  '''
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.home = self.path('home')
+    os.mkdir(self.home)
+
+    self.env = dict(os.environ, HOME=self.home,
+        GIT_AUTHOR_NAME='test', GIT_AUTHOR_EMAIL='test@example.com',
+        GIT_COMMITTER_NAME='test', GIT_COMMITTER_EMAIL='test@example.com')
+
+    # the upstream repo we develop in, and the bare one it publishes to
+    self.upstream = self.path('upstream')
+    os.mkdir(self.upstream)
+    self.git(self.upstream, 'init', '--quiet')
+    shutil.copytree(PARTY_DIR, os.path.join(self.upstream, 'party'),
+        ignore=shutil.ignore_patterns('*.pyc'))
+    self.write(self.upstream, '.gitignore', '*.pyc\n')
+    self.write(self.upstream, '_bashrc', 'one\n')
+    self.commit(self.upstream, 'init')
+    self.git(self.root, 'clone', '--quiet', '--bare', self.upstream,
+        'upstream.git')
+    self.git(self.upstream, 'remote', 'add', 'pub', self.path('upstream.git'))
+
+    # the user's fork, and their clone of it
+    self.git(self.root, 'clone', '--quiet', '--bare', self.upstream,
+        'origin.git')
+    self.git(self.root, 'clone', '--quiet', 'origin.git', 'work')
+    self.work = self.path('work')
+
+    self.write(self.home, '.party.json',
+        '{"update_remote": "%s"}' % self.path('upstream.git'))
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def path(self, *names):
+    return os.path.join(self.root, *names)
+
+  def write(self, repo, name, text):
+    with open(os.path.join(repo, name), 'w') as f:
+      f.write(text)
+
+  def git(self, cwd, *args):
+    return subprocess.check_output(('git',) + args, cwd=cwd,
+        env=self.env).decode('utf-8')
+
+  def commit(self, repo, msg):
+    self.git(repo, 'add', '--all')
+    self.git(repo, 'commit', '--quiet', '-m', msg)
+
+  def publish(self, name, text):
+    '''Commit a change to a file upstream, and publish it.'''
+    self.write(self.upstream, name, text)
+    self.commit(self.upstream, 'change ' + name)
+    self.git(self.upstream, 'push', '--quiet', 'pub', 'master')
+
+  def update(self):
+    '''Run `dotparty update` in the work repo, and return its exit code.'''
+
+    process = subprocess.Popen([sys.executable, 'party/dotparty.py', 'update'],
+        cwd=self.work, env=self.env, stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT)
+    self.output = process.communicate()[0].decode('utf-8')
+    return process.returncode
+
+  def read_work(self, name):
+    with open(os.path.join(self.work, name)) as f:
+      return f.read()
+
+  def test_update_before_recording_upstream(self):
+    # update the way we did before we recorded what we applied
+    self.publish('_bashrc', 'two\n')
+    self.git(self.work, 'fetch', '--quiet', self.path('upstream.git'))
+    self.git(self.work, 'merge', '--squash', '--quiet', 'FETCH_HEAD')
+    self.git(self.work, 'commit', '--quiet', '-m', 'Update dotparty')
+    head = self.git(self.work, 'rev-parse', 'HEAD')
+
+    self.assertEqual(self.update(), 0, self.output)
+    self.assertIn('Already up-to-date!', self.output)
+    self.assertEqual(self.git(self.work, 'rev-parse', 'HEAD'), head)
+    self.assertEqual(self.git(self.work, 'rev-parse', constants.UPSTREAM_REF),
+        self.git(self.upstream, 'rev-parse', 'HEAD'))
+
+    # and later updates still apply
+    self.publish('_bashrc', 'three\n')
+    self.assertEqual(self.update(), 0, self.output)
+    self.assertEqual(self.read_work('_bashrc'), 'three\n')
+
+  def test_consecutive_updates_to_one_file(self):
+    self.write(self.work, 'notes', 'untracked\n')
+
+    for text in ('two\n', 'three\n'):
+      self.publish('_bashrc', text)
+      self.assertEqual(self.update(), 0, self.output)
+      self.assertEqual(self.read_work('_bashrc'), text)
+
+    self.assertEqual(self.git(self.work, 'status', '--porcelain'),
+        '?? notes\n')
+    self.assertEqual(self.git(self.work, 'stash', 'list'), '')
+
+  def test_staged_changes_refuse_update(self):
+    self.write(self.work, '_bashrc', 'staged\n')
+    self.git(self.work, 'add', '_bashrc')
+    self.publish('_bashrc', 'two\n')
+
+    self.assertEqual(self.update(), 1, self.output)
+    self.assertIn('uncommitted changes', self.output)
+    self.assertEqual(self.read_work('_bashrc'), 'staged\n')
+    self.assertEqual(self.git(self.work, 'status', '--porcelain'),
+        'M  _bashrc\n')
+
+  def test_conflicting_update_rolls_back(self):
+    self.publish('_bashrc', 'two\n')
+    self.assertEqual(self.update(), 0, self.output)
+
+    self.write(self.work, '_bashrc', 'local\n')
+    self.commit(self.work, 'local change')
+    head = self.git(self.work, 'rev-parse', 'HEAD')
+    self.write(self.work, 'notes', 'untracked\n')
+    self.publish('_bashrc', 'three\n')
+
+    self.assertEqual(self.update(), 1, self.output)
+    self.assertIn('conflicts', self.output)
+    self.assertEqual(self.git(self.work, 'rev-parse', 'HEAD'), head)
+    self.assertEqual(self.read_work('_bashrc'), 'local\n')
+    self.assertEqual(self.git(self.work, 'status', '--porcelain'),
+        '?? notes\n')
+    self.assertEqual(self.git(self.work, 'stash', 'list'), '')
+
+if __name__ == '__main__':
+  unittest.main()
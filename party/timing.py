@@ -0,0 +1,88 @@
+from __future__ import unicode_literals
+
+import contextlib
+import json
+import threading
+import timeit
+
+# the wall time spent in each named phase, the number of times each named
+# operation happened, and the named results of the whole run. phases are kept
+# in the order they were first entered.
+_phases = {}
+_phase_order = []
+_counters = {}
+_values = {}
+
+# operations may be counted from worker threads
+_lock = threading.Lock()
+
+@contextlib.contextmanager
+def phase(name):
+  '''
+  Time the wrapped block and add its wall time to the named phase. Phases may
+  nest, in which case the outer phase's time includes the inner's.
+  '''
+
+  start = timeit.default_timer()
+  try:
+    yield
+  finally:
+    elapsed = timeit.default_timer() - start
+    with _lock:
+      if name not in _phases:
+        _phases[name] = 0.0
+        _phase_order.append(name)
+      _phases[name] += elapsed
+
+def count(name, n=1):
+  '''Add n to the named counter.'''
+  with _lock:
+    _counters[name] = _counters.get(name, 0) + n
+
+def record(name, value):
+  '''Record a JSON-serializable result of the run, replacing any earlier one.'''
+  with _lock:
+    _values[name] = value
+
+def get_phase(name):
+  '''Return the seconds spent in the named phase so far, or None if unused.'''
+  return _phases.get(name)
+
+def get_count(name):
+  '''Return the value of the named counter, or 0 if it was never counted.'''
+  return _counters.get(name, 0)
+
+def get_value(name):
+  '''Return the named result of the run, or None if it wasn't recorded.'''
+  return _values.get(name)
+
+def report():
+  '''Return a JSON-serializable report of every phase, counter, and result.'''
+
+  with _lock:
+    return {
+      'phases': [{'name': n, 'seconds': _phases[n]} for n in _phase_order],
+      'counters': dict(_counters),
+      'values': dict(_values),
+    }
+
+def format_report():
+  '''Return a human-readable version of the report, one item per line.'''
+
+  data = report()
+
+  lines = ['phases:']
+  for p in data['phases']:
+    lines.append('  %-16s %9.2fms' % (p['name'], p['seconds'] * 1000))
+
+  lines.append('operations:')
+  for name in sorted(data['counters'].keys()):
+    lines.append('  %-16s %9d' % (name, data['counters'][name]))
+
+  if len(data['values']) > 0:
+    lines.append('results:')
+    for name in sorted(data['values'].keys()):
+      lines.append('  %-16s %s' % (name, json.dumps(data['values'][name],
+          sort_keys=True)))
+
+  return '\n'.join(lines)
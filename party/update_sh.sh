@@ -1,4 +0,0 @@
-#!/usr/bin/env bash
-
-URL=https://raw.github.com/amoffat/sh/master/sh.py
-curl -o sh.py $URL
@@ -2,18 +2,37 @@ from __future__ import unicode_literals
 from __future__ import print_function
 
 import errno
-import glob
+import hashlib
+import json
 import os
 import re
 import shutil
+import stat
+import subprocess
 import sys
 
+import timing
+
+# the most normalized paths we'll remember before forgetting them all
+NORMPATH_CACHE_SIZE = 16384
+_normpath_cache = {}
+
 # groups version numbers from strings like 'git version 1.8.3.2'
 GIT_VERSION_REGEX = re.compile('(\d+(?:\.\d+)+)')
 
-def mkdir(path, mode=0o0755):
-  '''Create a directory, analogous to `mkdir -p`. mode defaults to 0755.'''
+def mkdir(path, mode=0o0755, cache=None):
+  '''
+  Create a directory, analogous to `mkdir -p`. mode defaults to 0755.
+
+  If `cache` is a set, directories in it are assumed to exist and are skipped,
+  and the directory and all its ancestors are added to it once created. This
+  lets bulk operations create or verify each directory only once.
+  '''
+
+  if cache is not None and path in cache:
+    return
 
+  timing.count('mkdir')
   try:
     os.makedirs(path, mode)
   except OSError as e:
@@ -22,12 +41,19 @@ def mkdir(path, mode=0o0755):
     else:
       raise
 
+  # makedirs guarantees that every ancestor exists too
+  if cache is not None:
+    while path not in cache:
+      cache.add(path)
+      path = os.path.dirname(path)
+
 def rm(path, force=False):
   '''
   Remove a file. If force is True, can also remove a directory. Doesn't complain
   about non-existent directories.
   '''
 
+  timing.count('rm')
   try:
     # try to remove it as a simple file
     os.remove(path)
@@ -47,8 +73,39 @@ def rm(path, force=False):
         if e.errno != errno.ENOENT:
           raise
 
+def write_file(path, text):
+  '''
+  Write some text to a file as UTF-8, creating its directory if needed. The
+  file is written under a temporary name and renamed into place, so readers
+  never see a half-written file.
+  '''
+
+  # a bare file name is in the current directory, which already exists
+  directory = os.path.dirname(path)
+  if directory != '':
+    mkdir(directory)
+
+  tmp_path = '%s.%d.tmp' % (path, os.getpid())
+  try:
+    with open(tmp_path, 'wb') as f:
+      f.write(text.encode('utf-8'))
+    os.rename(tmp_path, path)
+  except:
+    rm(tmp_path)
+    raise
+
+def write_json(path, data):
+  '''Write some data to a JSON file atomically, as `write_file` does.'''
+  write_file(path, json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+def fingerprint(data):
+  '''Return a hex digest that identifies some JSON-serializable data.'''
+  encoded = json.dumps(data, sort_keys=True, separators=(',', ':'))
+  return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
 def cp(src, dest, recursive=False):
   '''Copy a file, or directory tree if recursive is True. Copies permissions.'''
+  timing.count('cp')
   if recursive and os.path.isdir(src):
     shutil.copytree(src, dest)
   else:
@@ -71,8 +128,8 @@ def to_list(*values):
 
   return []
 
-def normpath(path, absolute=False, root=None):
-  '''Thoroughly normalize a path name, optionally as an absolute path.'''
+def _normpath(path, root):
+  '''Normalize a path name, joined to root if given, without memoization.'''
 
   # join the path to the root directory if specified
   if root is not None:
@@ -82,19 +139,42 @@ def normpath(path, absolute=False, root=None):
   path = os.path.normpath(path)
   path = os.path.normcase(path)
 
+  return path
+
+def normpath(path, absolute=False, root=None):
+  '''
+  Thoroughly normalize a path name, optionally as an absolute path.
+
+  The same paths get normalized over and over again, so results are memoized.
+  Making a path absolute depends on the current directory, which may change, so
+  that part is never memoized.
+  '''
+
+  key = (path, root)
+  try:
+    result = _normpath_cache[key]
+  except KeyError:
+    result = _normpath(path, root)
+
+    # start over rather than grow without bound. a plain dict is an order of
+    # magnitude cheaper than tracking recency on Python 2.
+    if len(_normpath_cache) >= NORMPATH_CACHE_SIZE:
+      _normpath_cache.clear()
+    _normpath_cache[key] = result
+
   if absolute:
-    path = os.path.abspath(path)
+    result = os.path.abspath(result)
 
-  return path
+  return result
 
 def normalize_to_root(path, root):
   '''
   Normalize a path to some root directory. If it's absolute, only normalizes.
   '''
 
-  is_absolute = os.path.isabs(path)
-  root = None if is_absolute else root
-  return normpath(path, absolute=is_absolute, root=root)
+  if os.path.isabs(path):
+    return normpath(path)
+  return normpath(path, root=root)
 
 def is_hidden(path):
   '''Return True if the file is hidden, False otherwise.'''
@@ -117,28 +197,16 @@ def toggle_hidden(path, hide):
   parts.append(base)
   return os.path.join(*parts)
 
-def expand_globs(files, root=None):
-  '''
-  Expand a list of files that may include globs and return the de-duplicated and
-  sorted result. Optionally rooted to some directory.
-  '''
-
-  expanded = set([])
-
-  for f in files:
-    f = normalize_to_root(f, root)
+def _remove_temp(path):
+  '''Remove a temporary file we created, if it exists.'''
 
-    # NOTE: all patterns (like '*foo') will be added to the result list
-    # verbatim. this shouldn't normally be a problem, but might become one if
-    # anybody names their files things like '*foo'.
-    for g in glob.iglob(f):
-      expanded.add(normalize_to_root(g, root))
-    else:
-      expanded.add(f)
-
-  return sorted(expanded)
+  try:
+    os.remove(path)
+  except OSError as e:
+    if e.errno != errno.ENOENT:
+      raise
 
-def symlink(link_dest, src, overwrite=None):
+def symlink(link_dest, src, overwrite=None, atomic=True, dirs=None):
   '''
   Create a link at link_dest that points to source. If there are intermediate
   directories that need creating for the link destination, those are created as
@@ -148,13 +216,30 @@ def symlink(link_dest, src, overwrite=None):
   already a link, otherwise it throws an error. If `overwrite` is True, if
   forces an overwrite. If it's False, it throws an error if any file exists at
   link_dest.
+
+  If `atomic` is True, the link is created under a temporary name next to
+  link_dest and renamed over it, so anything reading link_dest concurrently
+  sees either the old file or the new link, never nothing. Real directories
+  can't be renamed over, so those are always removed first.
+
+  `dirs` is an optional set of directories known to exist, as used by `mkdir`.
   '''
 
+  timing.count('symlink')
   link_dest = normpath(link_dest)
   src = normpath(src)
 
-  link_dest_exists = os.path.lexists(link_dest)
-  link_dest_is_link = os.path.islink(link_dest)
+  # a single lstat tells us everything we need to know about the destination
+  try:
+    link_dest_mode = os.lstat(link_dest).st_mode
+  except OSError as e:
+    if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+      raise
+    link_dest_mode = None
+
+  link_dest_exists = link_dest_mode is not None
+  link_dest_is_link = link_dest_exists and stat.S_ISLNK(link_dest_mode)
+  link_dest_is_dir = link_dest_exists and stat.S_ISDIR(link_dest_mode)
 
   # handle our error states
   error_msg = "Can't create link '%s', a %s with that name already exists!"
@@ -163,13 +248,34 @@ def symlink(link_dest, src, overwrite=None):
   elif overwrite is None and link_dest_exists and not link_dest_is_link:
     raise IOError(error_msg % (link_dest, 'non-link file'))
 
-  # remove the link file, since at this point we're allowed to in all cases
-  if link_dest_exists:
-    rm(link_dest, force=True)
+  # create all the directories needed to contain the link. if something already
+  # exists at the destination, its parent must exist too.
+  parent = os.path.dirname(link_dest)
+  if not link_dest_exists:
+    mkdir(parent, cache=dirs)
+
+  if atomic and not link_dest_is_dir:
+    # build the link off to the side, then rename it into place. rename
+    # atomically replaces the destination on POSIX systems.
+    tmp_dest = os.path.join(parent, '.%s.party-%d' % (
+        os.path.basename(link_dest), os.getpid()))
+
+    # the temporary link is ours, so removing it isn't counted as an rm
+    _remove_temp(tmp_dest)
+    os.symlink(src, tmp_dest)
+
+    try:
+      os.rename(tmp_dest, link_dest)
+    except OSError:
+      _remove_temp(tmp_dest)
+      raise
+  else:
+    # remove the existing file, since at this point we're allowed to in all
+    # cases, then create the link in its place.
+    if link_dest_exists:
+      rm(link_dest, force=True)
 
-  # create the link and all the directories needed to contain it
-  mkdir(os.path.dirname(link_dest))
-  os.symlink(src, link_dest)
+    os.symlink(src, link_dest)
 
 def is_descendant(child, parent):
   '''Returns True if child is a descendant directory of parent, else False.'''
@@ -194,29 +300,71 @@ def ensure_python_version(min_version=(2,7)):
   '''Ensure that we're using the minimum required Python version.'''
   ensure_version('Python', min_version, sys.version_info)
 
-def ensure_git_version(min_version=(1, 8)):
-  '''Ensure that we have access to the minimum required Git version.'''
+def which(name):
+  '''Return the full path to the named executable on the PATH, or None.'''
+
+  for directory in os.environ.get('PATH', os.defpath).split(os.pathsep):
+    path = os.path.join(directory, name)
+    if os.path.isfile(path) and os.access(path, os.X_OK):
+      return path
+
+  return None
+
+def ensure_git_version(min_version=(1, 8), cache_path=None):
+  '''
+  Ensure that we have access to the minimum required Git version. If a cache
+  path is given, the version found is cached there against the git binary's
+  path and modification time, so git only needs to be run again once it's been
+  upgraded or replaced.
+  '''
 
   # TODO: determine what the minimum supported Git version is
 
-  try:
-    from sh import git
-  except ImportError:
+  git_path = which('git')
+  if git_path is None:
     raise ValueError("'git' is required for dotparty to function")
 
-  # parse out the version info
-  raw = git.version().strip()
-  match = GIT_VERSION_REGEX.search(raw)
+  # resolve links so an upgrade behind something like /usr/bin/git is noticed
+  git_path = os.path.realpath(git_path)
+  signature = [git_path, os.stat(git_path).st_mtime]
+
+  version = None
+  if cache_path is not None:
+    try:
+      with open(cache_path) as f:
+        cached = json.load(f)
+      if cached.get('signature') == signature:
+        version = tuple(cached['version'])
+    except (IOError, ValueError, KeyError):
+      pass
+
+  if version is None:
+    # parse out the version info
+    timing.count('git')
+    with timing.phase('git'):
+      raw = subprocess.check_output([git_path, 'version'])
+    raw = raw.decode('utf-8').strip()
+    match = GIT_VERSION_REGEX.search(raw)
 
-  if not match:
-    print(match)
-    raise ValueError("Could not parse version info from output: '%s'" % raw)
+    if not match:
+      raise ValueError("Could not parse version info from output: '%s'" % raw)
+
+    # parse the version match like "1.2.3.4" into a tuple like (1, 2, 3, 4)
+    version = tuple(int(i) for i in match.group(1).split('.'))
+
+    # the cache is only an optimization, so failing to write it is fine
+    if cache_path is not None:
+      try:
+        write_json(cache_path, {'signature': signature, 'version': version})
+      except EnvironmentError:
+        pass
 
-  # parse the version match like "1.2.3.4" into a tuple like (1, 2, 3, 4)
-  version = tuple(int(i) for i in match.group(1).split('.'))
   ensure_version('Git', min_version, version)
 
 def ensure_required_software():
-  '''Make sure that we have access to all the required software/versions.'''
+  '''
+  Make sure that we have access to the software/versions that every command
+  requires. Git is only checked by the commands that use it, see
+  `ensure_git_version`.
+  '''
   ensure_python_version()
-  ensure_git_version()
@@ -0,0 +1,170 @@
+from __future__ import unicode_literals
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+import util
+
+# inotify event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+
+# every event that could mean a repo entry or its config file changed
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+    IN_MOVED_TO | IN_CREATE | IN_DELETE)
+
+# the fixed-size header of an inotify event: wd, mask, cookie, and name length
+EVENT_HEADER = struct.Struct(str('iIII'))
+
+def entry_name(name):
+  '''
+  Return the name of the repo entry a changed file name belongs to. Hidden
+  config files belong to the entry they configure.
+  '''
+  return util.toggle_hidden(name, False)
+
+def snapshot(path):
+  '''Return a dict mapping every name in a directory to its mtime and inode.'''
+
+  result = {}
+  for name in os.listdir(path):
+    try:
+      info = os.lstat(os.path.join(path, name))
+    except OSError as e:
+      # the file vanished between listing and stat-ing it
+      if e.errno != errno.ENOENT:
+        raise
+      continue
+
+    result[name] = (info.st_mtime, info.st_ino)
+
+  return result
+
+def open_inotify_watcher(path):
+  '''
+  Watch the given directory with inotify. Returns a function that takes a
+  timeout in seconds (or None to block) and returns the set of entry names that
+  changed in that time, or None if the watched directory's events overflowed
+  and everything must be assumed to have changed. Raises OSError if inotify
+  isn't available.
+  '''
+
+  libc_name = ctypes.util.find_library('c')
+  if not sys.platform.startswith('linux') or libc_name is None:
+    raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+
+  libc = ctypes.CDLL(libc_name, use_errno=True)
+  if not hasattr(libc, 'inotify_init'):
+    raise OSError(errno.ENOSYS, 'inotify is not supported by this libc')
+
+  fd = libc.inotify_init()
+  if fd < 0:
+    raise OSError(ctypes.get_errno(), 'Failed to initialize inotify')
+
+  path_bytes = path.encode(sys.getfilesystemencoding())
+  if libc.inotify_add_watch(fd, path_bytes, WATCH_MASK) < 0:
+    os.close(fd)
+    raise OSError(ctypes.get_errno(), "Failed to watch '%s'" % path)
+
+  def wait(timeout):
+    readable, _, _ = select.select([fd], [], [], timeout)
+    if not readable:
+      return set()
+
+    changed = set()
+    data = os.read(fd, 64 * 1024)
+    offset = 0
+    while offset < len(data):
+      wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+      offset += EVENT_HEADER.size
+
+      if mask & IN_Q_OVERFLOW:
+        return None
+
+      # names are NUL-padded to an alignment boundary
+      name = data[offset:offset + length].rstrip(b'\0')
+      offset += length
+
+      if name:
+        changed.add(entry_name(name.decode(sys.getfilesystemencoding())))
+
+    return changed
+
+  return wait
+
+def open_polling_watcher(path, interval):
+  '''
+  Watch the given directory by comparing snapshots every `interval` seconds.
+  Returns a function with the same behavior as `open_inotify_watcher`'s.
+  '''
+
+  # keep the last snapshot in a list so the closure can replace it
+  last = [snapshot(path)]
+
+  def wait(timeout):
+    deadline = None if timeout is None else time.time() + timeout
+
+    while True:
+      # sleep for the interval, or whatever remains of the timeout
+      delay = interval
+      if deadline is not None:
+        delay = min(delay, max(0, deadline - time.time()))
+      time.sleep(delay)
+
+      current = snapshot(path)
+      previous = last[0]
+      last[0] = current
+
+      changed = set(entry_name(name)
+          for name in set(previous) | set(current)
+          if previous.get(name) != current.get(name))
+
+      if changed or (deadline is not None and time.time() >= deadline):
+        return changed
+
+  return wait
+
+def open_watcher(path, interval=1.0):
+  '''
+  Watch the given directory for changes, using inotify when it's available and
+  falling back to polling every `interval` seconds otherwise.
+  '''
+
+  try:
+    return open_inotify_watcher(path)
+  except (OSError, AttributeError):
+    return open_polling_watcher(path, interval)
+
+def debounce(wait, delay):
+  '''
+  Block until something changes, then keep collecting changes until none have
+  arrived for `delay` seconds, and return every changed name seen. Returns None
+  if any of the waits reported that everything must be assumed to have changed.
+  '''
+
+  changed = set()
+  while len(changed) == 0:
+    changed = wait(None)
+    if changed is None:
+      return None
+
+  while True:
+    more = wait(delay)
+    if more is None:
+      return None
+    if len(more) == 0:
+      return changed
+
+    changed |= more